@@ -1,17 +1,74 @@
+from django import forms
 from django.contrib.gis import admin
+from django.core.files.storage import default_storage
+from django.db import transaction
 
 # Register your models here.
+from .imports import ImportFormatError, check_source, start_import
 from .models import (
     Profile, Garage, Service, GarageService, PartCategory,
-    Part, Review, ForumThread, ForumPost
+    Part, Review, ForumThread, ForumPost, ImportRun
 )
 
 # Use GISModelAdmin for Garage to get a map widget
 @admin.register(Garage)
 class GarageAdmin(admin.GISModelAdmin):
-    list_display = ('name', 'city', 'owner', 'is_verified')
+    list_display = ('name', 'city', 'owner', 'is_verified', 'average_rating', 'rating_count')
+    readonly_fields = ('average_rating', 'rating_count', 'rating_sum')
     list_filter = ('is_verified', 'city', 'country')
-    search_fields = ('name', 'city', 'owner__username')
+    search_fields = ('name', 'city', 'owner__username', 'external_ref')
+
+class ImportRunForm(forms.ModelForm):
+    upload = forms.FileField(help_text="CSV, GeoJSON or newline-delimited GeoJSON. Services and parts name their garage by garage_ref.")
+    class Meta:
+        model = ImportRun
+        fields = ('kind', 'owner')
+
+    def clean(self):
+        cleaned = super().clean()
+        upload = cleaned.get('upload')
+        if upload is not None:
+            try:
+                check_source(upload.name)
+            except ImportFormatError as exc:
+                self.add_error('upload', str(exc))
+        if cleaned.get('kind') == ImportRun.Kind.GARAGES and not cleaned.get('owner'):
+            self.add_error('owner', "Garage imports need an owner for the garages they create.")
+        return cleaned
+
+# Bulk onboarding: upload a file to start an import; failed runs can be resumed from the list
+@admin.register(ImportRun)
+class ImportRunAdmin(admin.ModelAdmin):
+    form = ImportRunForm
+    list_display = ('id', 'kind', 'source', 'status', 'rows_done', 'rows_failed', 'updated_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('source', 'status', 'rows_done', 'rows_failed', 'errors', 'message', 'created_at', 'updated_at')
+    actions = ['resume_imports']
+
+    def get_form(self, request, obj=None, **kwargs):
+        # Progress of an existing run is read-only; only new runs take an upload
+        if obj is not None:
+            kwargs['form'] = forms.ModelForm
+        return super().get_form(request, obj, **kwargs)
+
+    def get_readonly_fields(self, request, obj=None):
+        return self.readonly_fields + (('kind', 'owner') if obj is not None else ())
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            upload = form.cleaned_data['upload']
+            obj.source = default_storage.path(default_storage.save(f'imports/{upload.name}', upload))
+        super().save_model(request, obj, form, change)
+        if not change:
+            transaction.on_commit(lambda: start_import(obj))
+
+    @admin.action(description="Run or resume selected imports")
+    def resume_imports(self, request, queryset):
+        # A run that is really still going holds its lock and is left alone by the new worker
+        runs = list(queryset.exclude(status=ImportRun.Status.DONE))
+        for run in runs:
+            start_import(run)
+        self.message_user(request, f"Started {len(runs)} import(s); progress shows in the list.")
 
 admin.site.register(Profile)
 admin.site.register(Service)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.conf import settings
+        from . import signals  # noqa: F401
+        if getattr(settings, 'REQUEST_PROFILING', False):
+            from .profiling import instrument_serializers
+            instrument_serializers()
@@ -0,0 +1,168 @@
+"""
+Native async read path for garages, parts and reviews, served under ASGI.
+
+The DRF viewsets stay the single source of truth for filtering, ordering,
+prefetching and serialization; these views only replace the blocking
+queryset evaluation with Django's async ORM (``aiterator`` / ``aget``) so a
+worker is not held while PostGIS answers. Requests still pass each view's
+``initial()`` (authentication, permissions, throttles, replica choice) and
+its response cache, so these routes are no cheaper to abuse than the sync ones.
+
+The forum event streams (``api.live``) live here too: an open SSE
+connection costs a coroutine, not a worker thread.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.response import Response
+
+from . import live
+from .cache import CachedResponseMixin
+from .models import ForumThread
+from .renderers import FastJSONRenderer
+from .replicas import read_alias
+from .views import GarageViewSet, PartViewSet, ReviewListCreateView
+
+
+def _render(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def _as_http(response):
+    """Render a DRF ``Response`` (headers included) without content negotiation; other responses pass through."""
+    if not hasattr(response, 'data'):
+        return response
+    rendered = _render(response.data, status=response.status_code)
+    for header, value in response.items():
+        if header != 'Content-Type':
+            rendered[header] = value
+    return rendered
+
+
+async def _serve(view_class, request, action, respond, **kwargs):
+    """
+    Answer with ``respond(view)`` from the DRF view for ``action``, after the
+    view's own ``initial()``: authentication, permissions, throttles and the
+    replica choice apply exactly as on the sync route. Errors are rendered by
+    the view's exception handler.
+    """
+    view = view_class(action=action, args=(), kwargs=kwargs, format_kwarg=None)
+    view.action_map = {'get': action}
+    view.request = view.initialize_request(request, **kwargs)
+    view.headers = view.default_response_headers
+    # initial() may route reads to a replica; put the previous alias back afterwards
+    token = read_alias.set(None)
+    try:
+        await sync_to_async(view.initial)(view.request, **kwargs)
+        response = await respond(view)
+    except APIException as exc:
+        response = view.handle_exception(exc)
+    finally:
+        read_alias.reset(token)
+    return _as_http(response)
+
+
+async def _cached(view, handler):
+    """``handler()`` gives ``(status, data)``; views with a response cache go through it."""
+    if isinstance(view, CachedResponseMixin):
+        return await view.acached_response(handler, view.request)
+    status, data = await handler()
+    return Response(data, status=status)
+
+
+async def _queryset(view):
+    aget_queryset = getattr(view, 'aget_queryset', None)
+    if aget_queryset is not None:
+        return await aget_queryset()
+    # get_queryset() may geocode ?near=, which reads GeocodedPlace and can call the provider
+    return await sync_to_async(view.get_queryset)()
+
+
+async def _list(view):
+    async def handler():
+        page = await view.paginator.apaginate_queryset(await _queryset(view), view.request, view)
+        data = view.get_serializer(page, many=True).data
+        return 200, view.paginator.get_paginated_response(data).data
+    return await _cached(view, handler)
+
+
+async def _detail(view):
+    async def handler():
+        queryset = await _queryset(view)
+        try:
+            obj = await queryset.aget(pk=view.kwargs['pk'])
+        except queryset.model.DoesNotExist:
+            raise NotFound()
+        return 200, view.get_serializer(obj).data
+    return await _cached(view, handler)
+
+
+def handle_api_errors(func):
+    @wraps(func)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await func(request, *args, **kwargs)
+        except APIException as exc:
+            return _render({'detail': exc.detail}, status=exc.status_code)
+    return wrapper
+
+
+@require_GET
+async def garage_list(request):
+    return await _serve(GarageViewSet, request, 'list', _list)
+
+
+@require_GET
+async def garage_detail(request, pk):
+    return await _serve(GarageViewSet, request, 'retrieve', _detail, pk=pk)
+
+
+@require_GET
+async def part_list(request):
+    return await _serve(PartViewSet, request, 'list', _list)
+
+
+@require_GET
+async def part_detail(request, pk):
+    return await _serve(PartViewSet, request, 'retrieve', _detail, pk=pk)
+
+
+@require_GET
+async def garage_reviews(request, garage_pk):
+    return await _serve(ReviewListCreateView, request, 'list', _list, garage_pk=garage_pk)
+
+
+def _last_event_id(request):
+    # EventSource sends the header on reconnects; the query parameter covers first connects
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try: return int(value) if value else None
+    except ValueError: return None
+
+
+def _event_stream(request, channel, history):
+    response = StreamingHttpResponse(
+        live.event_stream(channel, history, _last_event_id(request)), content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+@handle_api_errors
+async def forum_thread_stream(request):
+    """SSE: ``thread`` events for every new thread."""
+    return _event_stream(request, live.THREADS, live.thread_history)
+
+
+@require_GET
+@handle_api_errors
+async def forum_post_stream(request, thread_pk):
+    """SSE: ``post`` events for new replies in one thread."""
+    if not await ForumThread.objects.filter(pk=thread_pk).aexists():
+        raise NotFound()
+    return _event_stream(request, thread_pk, live.post_history(thread_pk))
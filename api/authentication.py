@@ -0,0 +1,147 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .models import AuthToken
+
+# v3 entries hold the user fields below, never the password hash
+CACHE_PREFIX = 'auth-token:v3'
+# What authentication and the permission classes read off request.user. Any
+# other field is loaded on first access, like a deferred field.
+CACHED_USER_FIELDS = ('id', 'username', 'email', 'is_active', 'is_staff', 'is_superuser')
+
+
+def token_digest(key):
+    """SHA-256 of the raw token: the stored primary key and the cache key alike."""
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def token_cache_key(digest):
+    return f'{CACHE_PREFIX}:{digest}'
+
+
+def issue_token(user):
+    """
+    Replace ``user``'s token with a fresh one. Only the digest is saved; the
+    returned instance carries the raw key in ``key`` for the login response.
+    """
+    key = secrets.token_hex(20)
+    with transaction.atomic():
+        AuthToken.objects.filter(user=user).delete()
+        token = AuthToken.objects.create(digest=token_digest(key), user=user)
+    token.key = key
+    return token
+
+
+def create_token(token_model, user, serializer):
+    """``REST_AUTH['TOKEN_CREATOR']``: a login always issues a new key, as the old one cannot be shown again."""
+    return issue_token(user)
+
+
+class TTLCache:
+    """Small thread-safe LRU whose entries also expire after ``ttl`` seconds."""
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Per-process first level. Kept short-lived because other processes cannot
+# evict it; the shared cache below is invalidated explicitly.
+local_tokens = TTLCache(
+    maxsize=getattr(settings, 'AUTH_TOKEN_LRU_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_TOKEN_LRU_TTL', 5),
+)
+
+
+def invalidate_token(digest):
+    local_tokens.delete(digest)
+    cache.delete(token_cache_key(digest))
+
+
+def invalidate_tokens_on_commit(digests):
+    """``invalidate_token`` once the transaction commits, so a racing read cannot re-cache the old row."""
+    digests = list(digests)
+    transaction.on_commit(lambda: [invalidate_token(digest) for digest in digests])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    ``TokenAuthentication`` against ``AuthToken`` digests, with the
+    ``api_authtoken JOIN auth_user`` lookup served from an in-process TTL LRU,
+    then the shared cache, then the database. Both cache tiers hold the token's
+    creation time and ``CACHED_USER_FIELDS``, so a hit costs no query. Entries
+    are dropped when the token is deleted or its user is saved (e.g.
+    deactivated); see ``api.signals``.
+    """
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        digest = token_digest(key)
+        entry = local_tokens.get(digest)
+        if entry is None:
+            entry = self.load_entry(digest)
+            local_tokens.set(digest, entry)
+
+        # A fresh instance per request: cached entries are shared between threads
+        User = get_user_model()
+        fields = entry['user']
+        user = User.from_db(router.db_for_read(User), list(fields), list(fields.values()))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token = AuthToken(digest=digest, user=user, created=entry['created'])
+        token.key = key
+        return user, token
+
+    def load_entry(self, digest):
+        cache_key = token_cache_key(digest)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry
+        row = (AuthToken.objects.filter(digest=digest)
+               .values('created', *(f'user__{name}' for name in CACHED_USER_FIELDS)).first())
+        if row is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        # from_db() wants the loaded fields in model order
+        names = [f.attname for f in get_user_model()._meta.concrete_fields if f.attname in CACHED_USER_FIELDS]
+        entry = {'created': row['created'], 'user': {name: row[f'user__{name}'] for name in names}}
+        cache.set(cache_key, entry, getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60))
+        return entry
@@ -0,0 +1,270 @@
+"""
+Seeding and measurement helpers shared by the ``benchmark_api`` management
+command and the query-budget tests.
+"""
+import random
+import time
+from dataclasses import dataclass, field
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from .authentication import issue_token
+from .fastpath import compile_serializer
+from .forum import rebuild_thread_summaries
+from .models import (
+    ForumPost, ForumThread, Garage, GarageService, Part, PartCategory, Review, Service
+)
+from .offers import rebuild_offers
+from .ratings import rebuild_rating_stats
+from .renderers import FastJSONRenderer, orjson
+from .serializers import GarageSerializer, PartSerializer, ReviewSerializer
+from .tiles import tile_for_point
+
+# Nairobi; garages are scattered within roughly +/-0.3 degrees of it
+CENTER = (36.82, -1.29)
+CITIES = ['Nairobi', 'Thika', 'Kiambu', 'Machakos', 'Kajiado']
+BATCH_SIZE = 2000
+
+
+@dataclass
+class Volume:
+    garages: int = 500
+    reviews_per_garage: int = 20
+    services_per_garage: int = 8
+    parts_per_garage: int = 20
+    threads: int = 200
+    posts_per_thread: int = 25
+
+
+@dataclass
+class Endpoint:
+    name: str
+    url: str
+    # Maximum queries for one cold (uncached) request; must not grow with volume
+    query_budget: int
+    # Extra request headers, e.g. credentials for routes that need a user
+    headers: dict = field(default_factory=dict)
+
+
+@dataclass
+class Measurement:
+    endpoint: Endpoint
+    queries: int
+    p50_ms: float
+    p95_ms: float
+    response_bytes: int
+
+    @property
+    def over_budget(self):
+        return self.queries > self.endpoint.query_budget
+
+
+@dataclass
+class SerializerTiming:
+    name: str
+    rows: int
+    # Best-of-repeats microseconds per row, queryset evaluation included
+    regular_us: float
+    compiled_us: float
+
+    @property
+    def speedup(self):
+        return self.regular_us / self.compiled_us
+
+
+def seed(volume=None, seed=0):
+    """Bulk-load a realistic object graph; signals are bypassed and aggregates rebuilt after."""
+    volume = volume or Volume()
+    rng = random.Random(seed)
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=f'bench{i}', email=f'bench{i}@example.com')
+            for i in range(max(volume.reviews_per_garage, 50))
+        ], batch_size=BATCH_SIZE)
+        services = Service.objects.bulk_create([
+            Service(name=f'Service {i}') for i in range(max(volume.services_per_garage, 1))
+        ])
+        categories = PartCategory.objects.bulk_create([
+            PartCategory(name=name, slug=name.lower())
+            for name in ('Brakes', 'Engine', 'Suspension', 'Electrical', 'Body')
+        ])
+        garages = Garage.objects.bulk_create([
+            Garage(
+                owner=users[i % len(users)], name=f'Garage {i}', description='Bench garage',
+                address=f'{i} Bench Rd', city=rng.choice(CITIES), country='Kenya',
+                location=Point(CENTER[0] + rng.uniform(-0.3, 0.3), CENTER[1] + rng.uniform(-0.3, 0.3), srid=4326),
+                phone_number='0700000000', email=f'garage{i}@example.com', is_verified=rng.random() < 0.9,
+            )
+            for i in range(volume.garages)
+        ], batch_size=BATCH_SIZE)
+        GarageService.objects.bulk_create([
+            GarageService(garage=garage, service=service, price=rng.randint(10, 500))
+            for garage in garages for service in services[:volume.services_per_garage]
+        ], batch_size=BATCH_SIZE)
+        Review.objects.bulk_create([
+            Review(garage=garage, user=user, rating=rng.randint(1, 5), comment='Bench review')
+            for garage in garages for user in users[:volume.reviews_per_garage]
+        ], batch_size=BATCH_SIZE)
+        Part.objects.bulk_create([
+            Part(
+                seller_garage=garage, category=rng.choice(categories), name=f'{category_word} part {j}',
+                description='Bench part for testing the catalogue', price=rng.randint(5, 900),
+                stock=rng.randint(0, 20),
+            )
+            for garage in garages for j, category_word in
+            ((j, rng.choice(['Brake', 'Filter', 'Bulb', 'Shock', 'Mirror'])) for j in range(volume.parts_per_garage))
+        ], batch_size=BATCH_SIZE)
+        threads = ForumThread.objects.bulk_create([
+            ForumThread(title=f'Thread {i}', author=rng.choice(users)) for i in range(volume.threads)
+        ], batch_size=BATCH_SIZE)
+        ForumPost.objects.bulk_create([
+            ForumPost(thread=thread, author=rng.choice(users), content=f'Reply {j} with some advice.')
+            for thread in threads for j in range(volume.posts_per_thread)
+        ], batch_size=BATCH_SIZE)
+        rebuild_rating_stats()
+        rebuild_thread_summaries()
+        rebuild_offers()
+
+
+def endpoints():
+    """
+    Every GET route in api/urls.py with its per-request query budget. The SSE
+    streams never finish and ``metrics/`` reads no tables, so they are left out.
+    """
+    garage = Garage.objects.filter(is_verified=True).order_by('id').first()
+    part = Part.objects.filter(is_available=True).order_by('id').first()
+    thread = ForumThread.objects.order_by('id').first()
+    service = Service.objects.order_by('id').first()
+    lon, lat = CENTER
+    tile = tile_for_point(12, lon, lat)
+    garages = reverse('garage-list')
+    token = issue_token(garage.owner)
+    # The token lookup costs one query until the auth cache has it
+    auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+    return [
+        Endpoint('garage-list', garages, 1),
+        Endpoint('garage-list near', f'{garages}?lat={lat}&lon={lon}&radius_km=10', 1),
+        Endpoint('garage-list bbox', f'{garages}?bbox=36.7,-1.4,36.9,-1.2', 1),
+        Endpoint('garage-list by rating', f'{garages}?ordering=-rating&min_rating=3', 1),
+        Endpoint('garage-list expanded', f'{garages}?expand=owner,reviews,services_offered', 5),
+        Endpoint('garage-detail', reverse('garage-detail', args=[garage.pk]), 5),
+        Endpoint('garage-reviews', reverse('garage-reviews', args=[garage.pk]), 1),
+        Endpoint('garage-tiles', reverse('garage-tiles', args=[12, *tile]), 1),
+        Endpoint('service-offers', reverse('service-offers', args=[service.pk]) + f'?lat={lat}&lon={lon}', 1),
+        Endpoint('service-offers by distance',
+                 reverse('service-offers', args=[service.pk]) + f'?lat={lat}&lon={lon}&sort=distance', 1),
+        Endpoint('part-list', reverse('part-list'), 1),
+        Endpoint('part-list search', reverse('part-list') + '?q=brake&in_stock=1', 2),
+        Endpoint('part-detail', reverse('part-detail', args=[part.pk]), 1),
+        Endpoint('forumthread-list', reverse('forumthread-list'), 1),
+        Endpoint('forumthread-detail', reverse('forumthread-detail', args=[thread.pk]), 1),
+        Endpoint('forumthread-posts', reverse('forumthread-posts', args=[thread.pk]), 1),
+        Endpoint('export garages', reverse('export', args=['garages', 'ndjson']), 2, auth),
+        Endpoint('export parts', reverse('export', args=['parts', 'csv']), 2, auth),
+        Endpoint('export reviews', reverse('export', args=['reviews', 'ndjson']), 2, auth),
+        Endpoint('async garage-list', reverse('async-garage-list'), 1),
+        Endpoint('async garage-list near', reverse('async-garage-list') + f'?lat={lat}&lon={lon}&radius_km=10', 1),
+        Endpoint('async garage-detail', reverse('async-garage-detail', args=[garage.pk]), 5),
+        Endpoint('async garage-reviews', reverse('async-garage-reviews', args=[garage.pk]), 1),
+        Endpoint('async part-list', reverse('async-part-list'), 1),
+        Endpoint('async part-detail', reverse('async-part-detail', args=[part.pk]), 1),
+    ]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(client, endpoint, repeats=20):
+    """Time ``repeats`` cold requests (response cache cleared before each one)."""
+    timings = []
+    queries = 0
+    size = 0
+    for _ in range(repeats):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = client.get(endpoint.url, **endpoint.headers)
+            # Streaming exports only run their query while being consumed
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise AssertionError(f'{endpoint.name} returned {response.status_code}')
+        queries = max(queries, len(ctx.captured_queries))
+        size = len(body)
+    return Measurement(endpoint, queries, percentile(timings, 50), percentile(timings, 95), size)
+
+
+def run(client, repeats=20):
+    return [measure(client, endpoint, repeats) for endpoint in endpoints()]
+
+
+def format_report(measurements):
+    lines = [f"{'endpoint':<24} {'queries':>7} {'budget':>6} {'p50 ms':>8} {'p95 ms':>8} {'bytes':>9}"]
+    for m in measurements:
+        flag = '  OVER BUDGET' if m.over_budget else ''
+        lines.append(
+            f'{m.endpoint.name:<24} {m.queries:>7} {m.endpoint.query_budget:>6} '
+            f'{m.p50_ms:>8.1f} {m.p95_ms:>8.1f} {m.response_bytes:>9}{flag}'
+        )
+    return '\n'.join(lines)
+
+
+def serializer_cases():
+    """Serializers with a compiled path, each with the queryset its view would give the regular path."""
+    return [
+        ('GarageSerializer', GarageSerializer, Garage.objects.select_related('owner')
+         .prefetch_related('reviews__user', 'services_offered__service')),
+        ('PartSerializer', PartSerializer, Part.objects.select_related('seller_garage', 'category')),
+        ('ReviewSerializer', ReviewSerializer, Review.objects.select_related('user')),
+    ]
+
+
+def best_of(func, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def time_serializers(rows=500, repeats=5):
+    """
+    Per-row cost of ``serializer(..., many=True).data`` against the compiled
+    plan (api.fastpath) on the same rows, plus JSON rendering with and without
+    orjson. Raises if the two serializations differ.
+    """
+    timings = []
+    for name, serializer_class, queryset in serializer_cases():
+        queryset = queryset.order_by('pk')[:rows]
+        serializer = serializer_class(context={})
+        plan = compile_serializer(serializer)
+        columns, index = plan.bind(queryset)
+        regular, expected = best_of(lambda: serializer_class(queryset.all(), many=True, context={}).data, repeats)
+        compiled, data = best_of(
+            lambda: plan.render(serializer, list(queryset.prefetch_related(None).values_list(*columns)), index), repeats)
+        if JSONRenderer().render(data) != JSONRenderer().render(expected):
+            raise AssertionError(f'{name}: compiled output differs from the serializer')
+        count = len(data)
+        timings.append(SerializerTiming(name, count, regular / count * 1e6, compiled / count * 1e6))
+        if orjson is not None:
+            stdlib, _ = best_of(lambda: JSONRenderer().render(expected), repeats)
+            fast, _ = best_of(lambda: FastJSONRenderer().render(expected), repeats)
+            timings.append(SerializerTiming(f'{name} JSON render', count, stdlib / count * 1e6, fast / count * 1e6))
+    return timings
+
+
+def format_serializer_report(timings):
+    lines = [f"{'serializer':<30} {'rows':>6} {'regular us/row':>15} {'compiled us/row':>16} {'speedup':>8}"]
+    for t in timings:
+        lines.append(f'{t.name:<30} {t.rows:>6} {t.regular_us:>15.1f} {t.compiled_us:>16.1f} {t.speedup:>7.1f}x')
+    return '\n'.join(lines)
@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .replicas import pin_seconds, primary_reads
+
+KEY_PREFIX = 'response'
+DEFAULT_TIMEOUT = 300
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 0.05
+LOCK_MAX_WAIT = 2.0
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _version_key(namespace):
+    return f'{KEY_PREFIX}:ver:{namespace}'
+
+
+def _modified_key(namespace):
+    return f'{KEY_PREFIX}:mod:{namespace}'
+
+
+def _initial_version():
+    # Seeded from the clock so a flushed cache never reissues an old version (and ETag)
+    return time.time_ns()
+
+
+def get_namespace_state(namespaces):
+    """
+    ``(versions, last_modified)`` for ``namespaces`` in one round trip:
+    the current version of each and the Unix time of the latest change.
+    """
+    keys = [(_version_key(ns), _modified_key(ns)) for ns in namespaces]
+    found = cache.get_many([key for pair in keys for key in pair])
+    versions, modified = [], []
+    for version_key, modified_key in keys:
+        if version_key not in found:
+            cache.add(version_key, _initial_version(), None)
+            found[version_key] = cache.get(version_key, 0)
+        if modified_key not in found:
+            # Unknown history: claim "changed now" rather than risk a stale 304
+            cache.add(modified_key, time.time(), None)
+            found[modified_key] = cache.get(modified_key, time.time())
+        versions.append(found[version_key])
+        modified.append(found[modified_key])
+    return versions, max(modified)
+
+
+def get_versions(namespaces):
+    """Current version of each namespace."""
+    return get_namespace_state(namespaces)[0]
+
+
+def bump_namespace(namespace):
+    """
+    Invalidate every cached response in ``namespace`` by moving it to a new
+    version. Old entries are never deleted, they just stop being addressed
+    and age out through their TTL.
+    """
+    key = _version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, _initial_version(), None):
+            cache.incr(key)
+    cache.set(_modified_key(namespace), time.time(), None)
+
+
+def bump_namespaces_on_commit(namespaces):
+    transaction.on_commit(lambda: [bump_namespace(ns) for ns in namespaces])
+
+
+def record(namespace, outcome):
+    with _stats_lock:
+        _stats[(namespace, outcome)] += 1
+
+
+def get_cache_stats():
+    """Snapshot of in-process hit/miss counters keyed by (namespace, outcome)."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def response_cache_key(request, namespaces, vary_headers, versions=None):
+    query = sorted(request.query_params.lists())
+    parts = [request.method, request.path, repr(query)]
+    parts += [request.headers.get(header, '') for header in vary_headers]
+    digest = hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+    if versions is None:
+        versions = get_versions(namespaces)
+    versions = '.'.join(str(v) for v in versions)
+    return f'{KEY_PREFIX}:{namespaces[0]}:{versions}:{digest}'
+
+
+def response_etag(key):
+    """Weak validator for the response stored under ``key``; no body needed."""
+    return 'W/"%s"' % hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def get_or_set_locked(key, compute, timeout):
+    """
+    Return ``(value, hit)``. On a miss only one caller recomputes; the others
+    poll briefly for its result instead of stampeding the database. ``compute``
+    returns ``(value, cacheable)``.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value, True
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_MAX_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_WAIT)
+            value = cache.get(key)
+            if value is not None:
+                return value, True
+        value, _ = compute()
+        return value, False
+    try:
+        value, cacheable = compute()
+        if cacheable:
+            cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+    return value, False
+
+
+async def aget_or_set_locked(key, compute, timeout):
+    """``get_or_set_locked`` with an async ``compute``; waiting never blocks the event loop."""
+    value = await cache.aget(key)
+    if value is not None:
+        return value, True
+    lock_key = f'{key}:lock'
+    if not await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_MAX_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_WAIT)
+            value = await cache.aget(key)
+            if value is not None:
+                return value, True
+        value, _ = await compute()
+        return value, False
+    try:
+        value, cacheable = await compute()
+        if cacheable:
+            await cache.aset(key, value, timeout)
+    finally:
+        await cache.adelete(lock_key)
+    return value, False
+
+
+class CachedResponseMixin:
+    """
+    Caches ``list``/``retrieve`` response data under versioned namespaces.
+    Writes to the models listed in ``api.signals`` bump the namespace
+    version, so invalidation never needs wildcard deletes.
+
+    The same versions give every response an ETag and Last-Modified, so a
+    matching ``If-None-Match``/``If-Modified-Since`` gets a 304 before the
+    queryset or the cache entry is touched. ``acached_response`` does the
+    same for the async read path.
+    """
+    cache_namespaces = ()
+    cache_timeout = DEFAULT_TIMEOUT
+    cache_vary_headers = ('Host', 'Accept', 'Accept-Language', 'Authorization')
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key, validators, last_modified, not_modified = self.check_validators(request)
+        if not_modified is not None:
+            return not_modified
+
+        def compute():
+            with self.fresh_reads(last_modified):
+                response = handler(request, *args, **kwargs)
+            return (response.status_code, response.data), response.status_code == 200
+
+        (status, data), hit = get_or_set_locked(key, compute, self.cache_timeout)
+        return self.cached(status, data, hit, validators)
+
+    async def acached_response(self, handler, request):
+        """``cached_response`` for ``api.async_views``; ``handler()`` is awaited for ``(status, data)``."""
+        key, validators, last_modified, not_modified = await sync_to_async(self.check_validators)(request)
+        if not_modified is not None:
+            return not_modified
+
+        async def compute():
+            with self.fresh_reads(last_modified):
+                status, data = await handler()
+            return (status, data), status == 200
+
+        (status, data), hit = await aget_or_set_locked(key, compute, self.cache_timeout)
+        return self.cached(status, data, hit, validators)
+
+    def check_validators(self, request):
+        """
+        ``(key, validators, last_modified, not_modified)`` for the current
+        namespace versions; ``not_modified`` is the 304 to send, if any.
+        """
+        versions, last_modified = get_namespace_state(self.cache_namespaces)
+        key = response_cache_key(request, self.cache_namespaces, self.cache_vary_headers, versions)
+        validators = {'ETag': response_etag(key), 'Last-Modified': http_date(last_modified)}
+
+        not_modified = get_conditional_response(
+            request, etag=validators['ETag'], last_modified=int(last_modified),
+        )
+        if not_modified is not None:
+            record(self.cache_namespaces[0], 'not_modified')
+            not_modified = self.with_validators(not_modified, validators)
+        return key, validators, last_modified, not_modified
+
+    def fresh_reads(self, last_modified):
+        if time.time() - last_modified < pin_seconds():
+            # A replica may not have the change that bumped the version yet;
+            # don't cache its stale view under the new version
+            return primary_reads()
+        return nullcontext()
+
+    def cached(self, status, data, hit, validators):
+        record(self.cache_namespaces[0], 'hit' if hit else 'miss')
+        response = Response(data, status=status)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        if status == 200:
+            self.with_validators(response, validators)
+        return response
+
+    def with_validators(self, response, validators):
+        for header, value in validators.items():
+            response[header] = value
+        # The validators differ per credential/representation, like the cache key
+        patch_vary_headers(response, [h for h in self.cache_vary_headers if h != 'Host'])
+        return response
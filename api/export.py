@@ -0,0 +1,118 @@
+"""
+Constant-memory exports: rows are read through a server-side cursor
+(``values_list().iterator()``) and written to a ``StreamingHttpResponse`` as
+they arrive, so neither the queryset nor the serialized body is ever held
+in memory as a whole.
+
+Under ASGI Django would drain a synchronous iterator into a list before
+sending it, so ``alines`` hands the server an async iterator instead.
+"""
+import csv
+import json
+from dataclasses import dataclass
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.contrib.gis.geos import Point
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Garage, Part, Review
+
+CHUNK_SIZE = 2000
+# Lines written per hop to the sync thread by ``alines``
+ASYNC_BATCH_LINES = 500
+
+
+@dataclass
+class Export:
+    queryset: object
+    # (output column, ORM lookup)
+    columns: tuple
+    # Field compared against ?since= for incremental exports
+    since_field: str = None
+
+    @property
+    def header(self):
+        return [name for name, _ in self.columns]
+
+    def rows(self, since=None, since_id=None):
+        queryset = self.queryset.order_by('id')
+        if since is not None and self.since_field:
+            queryset = queryset.filter(**{f'{self.since_field}__gt': since})
+        if since_id is not None:
+            queryset = queryset.filter(id__gt=since_id)
+        lookups = [lookup for _, lookup in self.columns]
+        for row in queryset.values_list(*lookups).iterator(chunk_size=CHUNK_SIZE):
+            yield [plain(value) for value in row]
+
+
+def plain(value):
+    # GEOS points go out as [lon, lat]; everything else is JSON/CSV friendly already
+    if isinstance(value, Point):
+        return [value.x, value.y]
+    return value
+
+
+EXPORTS = {
+    'garages': Export(
+        Garage.objects.filter(is_verified=True),
+        (('id', 'id'), ('name', 'name'), ('address', 'address'), ('city', 'city'), ('country', 'country'),
+         ('location', 'location'), ('phone_number', 'phone_number'), ('email', 'email'), ('website', 'website'),
+         ('average_rating', 'average_rating'), ('rating_count', 'rating_count'), ('created_at', 'created_at'),
+         ('updated_at', 'updated_at')),
+        since_field='updated_at',
+    ),
+    'parts': Export(
+        Part.objects.all(),
+        (('id', 'id'), ('sku', 'sku'), ('seller_garage', 'seller_garage_id'), ('category', 'category__slug'),
+         ('name', 'name'), ('description', 'description'), ('price', 'price'), ('stock', 'stock'),
+         ('is_available', 'is_available'), ('updated_at', 'updated_at')),
+        since_field='updated_at',
+    ),
+    'reviews': Export(
+        Review.objects.all(),
+        (('id', 'id'), ('garage', 'garage_id'), ('user', 'user_id'), ('rating', 'rating'),
+         ('comment', 'comment'), ('created_at', 'created_at'), ('updated_at', 'updated_at')),
+        since_field='updated_at',
+    ),
+}
+
+
+def ndjson_lines(export, rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    header = export.header
+    for row in rows:
+        yield encoder.encode(dict(zip(header, row))) + '\n'
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the formatted line straight back."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(export, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(export.header)
+    for row in rows:
+        yield writer.writerow([json.dumps(v) if isinstance(v, list) else v for v in row])
+
+
+def _next_batch(lines):
+    return ''.join(islice(lines, ASYNC_BATCH_LINES))
+
+
+async def alines(lines):
+    """
+    Async iterator over ``lines`` for ASGI servers. Batches are pulled on the
+    thread-sensitive sync thread, where the server-side cursor lives.
+    """
+    lines = iter(lines)
+    while batch := await sync_to_async(_next_batch)(lines):
+        yield batch
+
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+    'csv': ('text/csv', csv_lines),
+}
@@ -0,0 +1,315 @@
+"""
+Compiled read-only serialization for large list responses.
+
+DRF resolves every field of every (nested) serializer again for each row it
+renders. ``compile_serializer`` walks a serializer's fields once per class and
+field set and turns them into a plan: the ``values_list()`` columns to fetch
+and, for each output key, a getter on the row tuple. Values go through the
+``to_representation`` of the field they stand for (or a builtin that is
+equivalent for database values, such as ``int`` or ``str``), so the output
+is the same as ``serializer.data``:
+
+* model fields, dotted ``source``s and annotations read one column;
+* nested serializers read their columns through the relation (a join);
+* ``many=True`` nested serializers on a reverse foreign key cost one extra
+  query per relation, like ``prefetch_related``;
+* ``SerializerMethodField``s and other fields that cannot be derived from
+  the model are read from the columns named in ``Meta.fast_sources``. A
+  method is called with a small row object that carries those attributes.
+
+Any other field makes the serializer uncompilable; ``CompiledListMixin`` then
+takes the regular path.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from types import SimpleNamespace
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import FileField
+from django.utils.encoding import is_protected_type
+from rest_framework import fields, relations, serializers
+
+# Same result as the field's to_representation() for values read from the database
+BUILTIN_CONVERTERS = {
+    fields.IntegerField: int,
+    fields.FloatField: float,
+    fields.BooleanField: bool,
+    fields.CharField: str,
+    fields.EmailField: str,
+    fields.URLField: str,
+    fields.SlugField: str,
+    fields.ReadOnlyField: lambda value: value,
+    relations.PrimaryKeyRelatedField: lambda value: value,
+}
+
+# Compiled plans kept per process, least recently used dropped first. Field
+# sets come from ?fields=/?expand=, so their number is up to the client.
+MAX_PLANS = 256
+
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+class NotCompilable(Exception):
+    pass
+
+
+def compile_serializer(serializer):
+    """The plan for ``serializer``'s class and field set, or None if a field is not supported."""
+    # serializer.fields only holds names the serializer accepted, in its own order
+    key = (type(serializer), tuple(sorted(serializer.fields)))
+    with _plans_lock:
+        if key in _plans:
+            _plans.move_to_end(key)
+            return _plans[key]
+    try:
+        plan = Plan(serializer)
+    except NotCompilable:
+        plan = None
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > MAX_PLANS:
+            _plans.popitem(last=False)
+    return plan
+
+
+def _get_field(model, name):
+    if name == 'pk':
+        return model._meta.pk
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # Sources name reverse relations by accessor (``review_set``), not by query name
+        for field in model._meta.related_objects:
+            if field.get_accessor_name() == name:
+                return field
+        raise
+
+
+def _field_path(model, lookup):
+    """Model fields along a ``__`` lookup; an unknown last name is taken for an annotation."""
+    path = []
+    names = lookup.split('__')
+    for position, name in enumerate(names):
+        try:
+            field = _get_field(model, name)
+        except FieldDoesNotExist:
+            if position == len(names) - 1:
+                return path
+            raise NotCompilable(lookup)
+        path.append(field)
+        if position < len(names) - 1:
+            if not (field.many_to_one or field.one_to_one) or not field.concrete:
+                raise NotCompilable(lookup)
+            model = field.related_model
+    return path
+
+
+def _resolve(serializer, path):
+    for name in path:
+        serializer = serializer.fields[name]
+        serializer = getattr(serializer, 'child', serializer)
+    return serializer
+
+
+class Relation:
+    """A ``many=True`` nested serializer over a reverse foreign key."""
+    def __init__(self, parent_column, relation, child):
+        self.parent_column = parent_column
+        self.foreign_key = relation.field
+        self.child = child
+
+    def fetch(self, root, parent_ids):
+        model = self.child.model
+        queryset = (model._default_manager.filter(**{f'{self.foreign_key.name}__in': parent_ids})
+                    .order_by(*(model._meta.ordering or ['pk'])))
+        columns, index = self.child.bind(queryset, offset=1)
+        rows = list(queryset.values_list(self.foreign_key.attname, *columns))
+        grouped = defaultdict(list)
+        for parent_id, item in zip((row[0] for row in rows), self.child.render(root, rows, index)):
+            grouped[parent_id].append(item)
+        return grouped
+
+
+class Plan:
+    def __init__(self, serializer, path=()):
+        self.model = serializer.Meta.model
+        self.path = path
+        self.columns = []
+        # Columns read by method fields; missing annotations there just read as None
+        self.optional = set()
+        self.relations = []
+        self.getters = self.compile(serializer, self.model, '', path)
+
+    def column(self, lookup, optional=False):
+        if lookup not in self.columns:
+            self.columns.append(lookup)
+        if optional:
+            self.optional.add(lookup)
+        return lookup
+
+    def compile(self, serializer, model, prefix, path):
+        fast_sources = getattr(getattr(serializer, 'Meta', None), 'fast_sources', {})
+        return [
+            (field.field_name, self.compile_field(field, model, prefix, path, fast_sources))
+            for field in serializer._readable_fields
+        ]
+
+    def compile_field(self, field, model, prefix, path, fast_sources):
+        name = field.field_name
+        if isinstance(field, serializers.SerializerMethodField):
+            if name not in fast_sources:
+                raise NotCompilable(name)
+            if any('__' in attr for attr in fast_sources[name]):
+                raise NotCompilable(name)
+            if prefix and any(not _field_path(model, attr) for attr in fast_sources[name]):
+                # Nested rows have no annotations to fall back on
+                raise NotCompilable(name)
+            return self.method_getter(path, field.method_name,
+                                      [(attr, self.column(prefix + attr, optional=True)) for attr in fast_sources[name]])
+        if name in fast_sources:
+            (lookup,) = fast_sources[name]
+            return self.value_getter(self.column(prefix + lookup), path, name, lambda field: field.to_representation)
+        if field.source == '*':
+            raise NotCompilable(name)
+        lookup = '__'.join(field.source_attrs)
+        model_fields = _field_path(model, lookup)
+        if any(f.null for f in model_fields[:-1]):
+            # DRF skips the key when a dotted source crosses a missing object
+            raise NotCompilable(name)
+
+        if isinstance(field, serializers.ListSerializer):
+            relation = model_fields[-1] if len(model_fields) == 1 else None
+            if relation is None or not relation.one_to_many or not isinstance(field.child, serializers.ModelSerializer):
+                raise NotCompilable(name)
+            child = Plan(field.child, path + (name,))
+            self.relations.append(Relation(self.column(prefix + 'pk'), relation, child))
+            return self.relation_getter(len(self.relations) - 1, self.relations[-1].parent_column)
+        if isinstance(field, serializers.BaseSerializer):
+            relation = model_fields[-1] if len(model_fields) == len(field.source_attrs) else None
+            if relation is None or not (relation.many_to_one or relation.one_to_one) or not relation.concrete:
+                raise NotCompilable(name)
+            if not isinstance(field, serializers.ModelSerializer):
+                raise NotCompilable(name)
+            nested_prefix = prefix + lookup + '__'
+            getters = self.compile(field, relation.related_model, nested_prefix, path + (name,))
+            return self.nested_getter(self.column(prefix + lookup), getters)
+
+        if len(model_fields) == len(field.source_attrs) and (
+                not model_fields[-1].concrete or model_fields[-1].many_to_many):
+            # Would fetch one row per related object
+            raise NotCompilable(name)
+        column = self.column(prefix + lookup)
+        if isinstance(field, fields.ModelField):
+            convert = self.model_field_converter(field.model_field)
+            return self.value_getter(column, path, name, lambda field: convert)
+        if isinstance(field, fields.FileField) and model_fields and isinstance(model_fields[-1], FileField):
+            model_field = model_fields[-1]
+            return self.value_getter(column, path, name, lambda field: lambda value: field.to_representation(
+                model_field.attr_class(None, model_field, value)))
+        if isinstance(field, relations.RelatedField) and not isinstance(field, relations.PrimaryKeyRelatedField):
+            raise NotCompilable(name)
+        if isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is not None:
+            raise NotCompilable(name)
+        builtin = BUILTIN_CONVERTERS.get(type(field))
+        return self.value_getter(column, path, name, lambda field: builtin or field.to_representation)
+
+    @staticmethod
+    def model_field_converter(model_field):
+        # fields.ModelField reads the value back off the instance
+        def convert(value):
+            if is_protected_type(value):
+                return value
+            return model_field.value_to_string(SimpleNamespace(**{model_field.attname: value}))
+        return convert
+
+    # Getter factories: called once per render with the root serializer, the
+    # column positions and the fetched relations; the result is called per row.
+    # Fields are looked up on that serializer, never kept from compile time,
+    # because their context (the request) differs between responses.
+
+    @staticmethod
+    def value_getter(column, path, name, converter):
+        def factory(root, index, state):
+            i, convert = index[column], converter(_resolve(root, path).fields[name])
+            return lambda row: None if row[i] is None else convert(row[i])
+        return factory
+
+    @staticmethod
+    def method_getter(path, method_name, attrs):
+        def factory(root, index, state):
+            method = getattr(_resolve(root, path), method_name)
+            positions = [(attr, index[column]) for attr, column in attrs]
+            return lambda row: method(SimpleNamespace(**{
+                attr: (row[i] if i is not None else None) for attr, i in positions
+            }))
+        return factory
+
+    @staticmethod
+    def nested_getter(column, getters):
+        def factory(root, index, state):
+            i = index[column]
+            bound = [(key, getter(root, index, state)) for key, getter in getters]
+            return lambda row: None if row[i] is None else {key: get(row) for key, get in bound}
+        return factory
+
+    @staticmethod
+    def relation_getter(position, column):
+        def factory(root, index, state):
+            i, children = index[column], state[position]
+            return lambda row: children.get(row[i], [])
+        return factory
+
+    def bind(self, queryset, offset=0):
+        """
+        ``(columns, index)``: what to pass to ``values_list()`` on ``queryset``
+        (after ``offset`` leading columns of the caller's) and the position of
+        each lookup in its rows. None if ``queryset`` lacks an annotation that
+        a field needs; optional ones that are missing read as None.
+        """
+        annotations = queryset.query.annotations
+        columns, index = [], {}
+        for lookup in self.columns:
+            root = lookup.split('__')[0]
+            if root != 'pk' and root not in annotations:
+                try:
+                    self.model._meta.get_field(root)
+                except FieldDoesNotExist:
+                    if lookup not in self.optional:
+                        return None
+                    index[lookup] = None
+                    continue
+            index[lookup] = len(columns) + offset
+            columns.append(lookup)
+        return columns, index
+
+    def render(self, root, rows, index):
+        """Output dicts for ``rows``, in order; ``root`` is the serializer the plan was compiled from."""
+        state = []
+        for relation in self.relations:
+            i = index[relation.parent_column]
+            parent_ids = {row[i] for row in rows}
+            state.append(relation.fetch(root, parent_ids) if parent_ids else {})
+        getters = [(key, factory(root, index, state)) for key, factory in self.getters]
+        return [{key: get(row) for key, get in getters} for row in rows]
+
+
+class CompiledListMixin:
+    """
+    Serves ``list`` from a compiled plan of the view's serializer. Views with
+    no paginator, serializers with unsupported fields and querysets missing
+    an annotation a field reads take the regular DRF path.
+    """
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        plan = compile_serializer(serializer)
+        if plan is None or self.paginator is None or not hasattr(self.paginator, 'paginate_values'):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        bound = plan.bind(queryset)
+        if bound is None:
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        columns, index = bound
+        rows = self.paginator.paginate_values(queryset, request, columns, view=self)
+        return self.get_paginated_response(plan.render(serializer, rows, index))
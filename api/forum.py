@@ -0,0 +1,76 @@
+import threading
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Left
+from django.utils.text import Truncator
+
+from .models import ForumPost, ForumThread
+
+EXCERPT_LENGTH = ForumThread._meta.get_field('last_post_excerpt').max_length
+
+# Threads whose delete is cascading to their posts on this thread of execution
+_deleting = threading.local()
+
+
+def deleting_threads():
+    if not hasattr(_deleting, 'ids'):
+        _deleting.ids = set()
+    return _deleting.ids
+
+
+def excerpt(content):
+    return Truncator(' '.join(content.split())).chars(EXCERPT_LENGTH)
+
+
+def record_new_post(post):
+    """Bump the thread's post count and make ``post`` its latest activity."""
+    ForumThread.objects.filter(pk=post.thread_id).update(
+        post_count=F('post_count') + 1,
+        last_post_at=post.created_at,
+        last_poster_id=post.author_id,
+        last_post_excerpt=excerpt(post.content),
+    )
+
+
+def record_edited_post(post):
+    """Refresh the excerpt if the edited post is the thread's latest one."""
+    latest = ForumPost.objects.filter(thread_id=post.thread_id).order_by('-created_at', '-id').values_list('pk', flat=True).first()
+    if latest == post.pk:
+        ForumThread.objects.filter(pk=post.thread_id).update(last_post_excerpt=excerpt(post.content))
+
+
+def record_deleted_post(post):
+    """Decrement the count and fall back to the previous post as latest activity."""
+    if post.thread_id in deleting_threads():
+        # The cascade from the thread's own delete; its summary goes with it
+        return
+    ForumThread.objects.filter(pk=post.thread_id).update(post_count=F('post_count') - 1)
+    refresh_last_post(post.thread_id)
+
+
+def refresh_last_post(thread_id):
+    latest = ForumPost.objects.filter(thread_id=thread_id).order_by('-created_at', '-id').first()
+    ForumThread.objects.filter(pk=thread_id).update(
+        last_post_at=latest.created_at if latest else None,
+        last_poster_id=latest.author_id if latest else None,
+        last_post_excerpt=excerpt(latest.content) if latest else '',
+    )
+
+
+def rebuild_thread_summaries(queryset=None):
+    """
+    Recompute the denormalized summary of every thread in ``queryset`` (all
+    threads by default) from the posts table, e.g. after bulk loads that
+    bypass signals. Returns the number of rows updated.
+    """
+    if queryset is None:
+        queryset = ForumThread.objects.all()
+    posts = ForumPost.objects.filter(thread=OuterRef('pk'))
+    latest = posts.order_by('-created_at', '-id')
+    count = posts.order_by().values('thread').annotate(c=Count('pk')).values('c')
+    return queryset.update(
+        post_count=Coalesce(Subquery(count, output_field=IntegerField()), Value(0)),
+        last_post_at=Subquery(latest.values('created_at')[:1]),
+        last_poster=Subquery(latest.values('author')[:1]),
+        last_post_excerpt=Coalesce(Subquery(latest.annotate(e=Left('content', EXCERPT_LENGTH)).values('e')[:1]), Value('')),
+    )
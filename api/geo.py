@@ -0,0 +1,42 @@
+from django.contrib.gis.db.models import PointField
+from django.contrib.gis.geos import Point, Polygon
+from django.db.models import FloatField, Func, Value
+
+
+class KNNDistance(Func):
+    """
+    PostGIS ``<->`` operator. On a GiST-indexed geography column this returns
+    the sphere distance in metres and lets ``ORDER BY`` walk the index
+    nearest-first instead of sorting every row.
+    """
+    arg_joiner = ' <-> '
+    template = '%(expressions)s'
+    output_field = FloatField()
+
+    def __init__(self, expression, point, **extra):
+        point_value = Value(point, output_field=PointField(srid=4326, geography=True))
+        super().__init__(expression, point_value, **extra)
+
+
+def parse_point(lat, lon):
+    """Return a WGS84 Point for the given lat/lon strings, or None if invalid."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return Point(lon, lat, srid=4326)
+
+
+def parse_bbox(value):
+    """Parse ``min_lon,min_lat,max_lon,max_lat`` into a Polygon, or None if invalid."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if min_lon >= max_lon or min_lat >= max_lat:
+        return None
+    bbox = Polygon.from_bbox((min_lon, min_lat, max_lon, max_lat))
+    bbox.srid = 4326
+    return bbox
@@ -0,0 +1,210 @@
+"""
+Geocoding: turns addresses and place names into WGS84 points.
+
+Lookups go through an in-process LRU, then the ``GeocodedPlace`` table, and
+only then the configured provider (``GEOCODER_PROVIDER``). Misses are cached
+too, so an unknown place is not sent to the provider on every request.
+Providers are plain classes with a ``name`` and a blocking
+``geocode(query) -> (lat, lon) | None``:
+
+* ``GeopyProvider`` wraps any geopy geocoder (Nominatim by default);
+* ``OfflineProvider`` answers from a small built-in gazetteer, for tests
+  and development without network access.
+"""
+import hashlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.contrib.gis.geos import Point
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .authentication import TTLCache
+from .models import GeocodedPlace
+
+NEAR_PATTERN = re.compile(r'^\s*(?:near|around|in)\s+', re.IGNORECASE)
+
+_provider = None
+_provider_lock = threading.Lock()
+
+local_places = TTLCache(
+    maxsize=getattr(settings, 'GEOCODER_LRU_SIZE', 2048),
+    ttl=getattr(settings, 'GEOCODER_LRU_TTL', 3600),
+)
+
+
+class GeocodingError(Exception):
+    """The provider could not be reached or refused the request; nothing was cached."""
+
+
+class GeopyProvider:
+    """
+    ``backend`` is a geopy service name; other options go to its geocoder
+    (``user_agent``, ``api_key``, ``timeout``...). ``min_delay_seconds``
+    spaces requests out across all threads, e.g. 1 for public Nominatim.
+    """
+    def __init__(self, backend='nominatim', min_delay_seconds=0, **options):
+        from geopy.extra.rate_limiter import RateLimiter
+        from geopy.geocoders import get_geocoder_for_service
+        self.name = backend
+        self._geocode = get_geocoder_for_service(backend)(**options).geocode
+        if min_delay_seconds:
+            self._geocode = RateLimiter(self._geocode, min_delay_seconds=min_delay_seconds, swallow_exceptions=False)
+
+    def geocode(self, query):
+        from geopy.exc import GeopyError
+        try:
+            location = self._geocode(query, exactly_one=True)
+        except GeopyError as exc:
+            raise GeocodingError(str(exc)) from exc
+        return (location.latitude, location.longitude) if location else None
+
+
+class OfflineProvider:
+    """Deterministic stand-in: the most specific known place named in the query wins."""
+    name = 'offline'
+    places = {
+        'nairobi': (-1.2864, 36.8172),
+        'westlands': (-1.2676, 36.8108),
+        'kilimani': (-1.2921, 36.7856),
+        'industrial area': (-1.3086, 36.8510),
+        'thika': (-1.0333, 37.0693),
+        'kiambu': (-1.1714, 36.8356),
+        'machakos': (-1.5177, 37.2634),
+        'kajiado': (-1.8524, 36.7768),
+        'mombasa': (-4.0435, 39.6682),
+        'kisumu': (-0.0917, 34.7680),
+        'nakuru': (-0.3031, 36.0800),
+        'eldoret': (0.5143, 35.2698),
+    }
+
+    def __init__(self, places=None):
+        if places is not None:
+            self.places = places
+
+    def geocode(self, query):
+        text = normalize(query)
+        matches = [name for name in self.places if re.search(rf'\b{re.escape(name)}\b', text)]
+        return self.places[max(matches, key=len)] if matches else None
+
+
+def get_provider():
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            provider_class = import_string(getattr(settings, 'GEOCODER_PROVIDER', 'api.geocoding.OfflineProvider'))
+            _provider = provider_class(**getattr(settings, 'GEOCODER_OPTIONS', {}))
+        return _provider
+
+
+@receiver(setting_changed)
+def reset_provider(setting, **kwargs):
+    global _provider
+    if setting in ('GEOCODER_PROVIDER', 'GEOCODER_OPTIONS'):
+        with _provider_lock:
+            _provider = None
+
+
+def normalize(query):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', query).casefold().split())
+
+
+def cache_key(query):
+    return hashlib.sha256(normalize(query).encode('utf-8')).hexdigest()
+
+
+def address_query(address='', city='', country=''):
+    return ', '.join(part.strip() for part in (address, city, country) if part and part.strip())
+
+
+def strip_near(text):
+    """``'near Westlands'`` -> ``'Westlands'``; other text is returned unchanged."""
+    return NEAR_PATTERN.sub('', text).strip()
+
+
+def _as_point(coords):
+    return Point(coords[1], coords[0], srid=4326) if coords is not None else None
+
+
+def _stored(keys):
+    """Cached DB rows for ``keys``; stale misses are left out so they get retried."""
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'GEOCODER_MISS_TTL', 86400))
+    rows = GeocodedPlace.objects.filter(key__in=keys).filter(Q(location__isnull=False) | Q(created_at__gte=stale))
+    return {row.key: row.location for row in rows}
+
+
+def _store(results, provider):
+    # update_conflicts: replaces a stale miss, and a concurrent writer of the same key is harmless
+    GeocodedPlace.objects.bulk_create(
+        [GeocodedPlace(key=key, query=query, location=point, provider=provider.name)
+         for key, (query, point) in results.items()],
+        update_conflicts=True, unique_fields=['key'], update_fields=['location', 'provider', 'created_at'],
+        batch_size=1000,
+    )
+
+
+def _lookup(provider, queries, max_workers):
+    """Provider answers in query order; a ``GeocodingError`` stands in for a failed lookup."""
+    def attempt(query):
+        try:
+            return provider.geocode(query)
+        except GeocodingError as exc:
+            return exc
+    if max_workers <= 1:
+        return [attempt(query) for query in queries]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(attempt, queries))
+
+
+def geocode(query):
+    """Point for ``query`` or None. Raises ``GeocodingError`` if the provider fails."""
+    return geocode_many([query])[query]
+
+
+def geocode_many(queries, max_workers=None):
+    """
+    ``{query: Point | None}`` for every query. Cache hits cost one DB query in
+    total; the rest are sent to the provider from at most ``max_workers``
+    (``GEOCODER_CONCURRENCY``) threads at a time. A provider failure is raised
+    after the successful lookups have been cached.
+    """
+    keys = {}
+    for query in queries:
+        keys.setdefault(cache_key(query), query)
+    found = {}
+    for key in keys:
+        entry = local_places.get(key)
+        if entry is not None:
+            found[key] = entry[0]
+    missing = [key for key in keys if key not in found]
+    if missing:
+        stored = _stored(missing)
+        for key, point in stored.items():
+            local_places.set(key, (point,))
+        found.update(stored)
+        missing = [key for key in missing if key not in stored]
+
+    if missing:
+        provider = get_provider()
+        max_workers = min(max_workers or getattr(settings, 'GEOCODER_CONCURRENCY', 4), len(missing))
+        results, error = {}, None
+        for key, outcome in zip(missing, _lookup(provider, [keys[key] for key in missing], max_workers)):
+            if isinstance(outcome, GeocodingError):
+                error = outcome
+                continue
+            point = _as_point(outcome)
+            results[key] = (keys[key], point)
+            found[key] = point
+            local_places.set(key, (point,))
+        if results:
+            _store(results, provider)
+        if error is not None:
+            raise error
+
+    return {query: found[cache_key(query)] for query in queries}
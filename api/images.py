@@ -0,0 +1,144 @@
+"""
+Thumbnail/rendition pipeline for uploaded images.
+
+Uploads are stored untouched; after the transaction commits, the original is
+decoded and resized in a separate process pool so request threads never
+block on Pillow. Results are written back to the model's ``*_renditions``
+JSON field as ``{'source': <original name>, 'items': [{path, width, height,
+format}, ...]}``.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from .cache import bump_namespaces_on_commit
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (160, 480, 960)
+RENDITION_FORMATS = {'webp': 'WEBP', 'avif': 'AVIF'}
+RENDITION_DIR = 'renditions'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def available_formats():
+    from PIL import features
+    # AVIF needs a Pillow build with libavif; WebP is practically always there
+    return [ext for ext in RENDITION_FORMATS if ext in features.modules and features.check_module(ext)]
+
+
+def render(source_path, output_dir, widths=RENDITION_WIDTHS, formats=None):
+    """
+    Decode ``source_path`` once and write every width/format pair into
+    ``output_dir``. Runs in a worker process; needs Pillow only, no Django.
+    Widths larger than the original are skipped rather than upscaled.
+    """
+    from PIL import Image, ImageOps
+
+    formats = formats or available_formats()
+    os.makedirs(output_dir, exist_ok=True)
+    items = []
+    with Image.open(source_path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+        for width in widths:
+            if width > original.width:
+                continue
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.Resampling.LANCZOS)
+            for ext in formats:
+                filename = f'{width}w.{ext}'
+                resized.save(os.path.join(output_dir, filename), RENDITION_FORMATS[ext], quality=80)
+                items.append({'file': filename, 'width': width, 'height': height, 'format': ext})
+    return items
+
+
+def rendition_dir(name):
+    stem, _ = os.path.splitext(name)
+    return f'{RENDITION_DIR}/{stem}'
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: workers must not inherit the parent's DB connections or threads
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def store_renditions(model, pk, field_name, source, items):
+    """Persist results, unless the image was replaced while it was being processed."""
+    directory = rendition_dir(source)
+    renditions = {
+        'source': source,
+        'items': [
+            {'path': f"{directory}/{item['file']}", 'width': item['width'],
+             'height': item['height'], 'format': item['format']}
+            for item in items
+        ],
+    }
+    # Same namespaces as a save of the model; .update() sends no signals
+    from .signals import CACHE_NAMESPACES
+    close_old_connections()
+    try:
+        updated = model.objects.filter(pk=pk, **{field_name: source}).update(**{f'{field_name}_renditions': renditions})
+        if updated:
+            bump_namespaces_on_commit(CACHE_NAMESPACES.get(model, ()))
+    finally:
+        close_old_connections()
+
+
+def process_image(instance, field_name, sync=False):
+    """Render ``instance.<field_name>``; in the process pool unless ``sync``."""
+    source = getattr(instance, field_name).name
+    source_path = default_storage.path(source)
+    output_dir = default_storage.path(rendition_dir(source))
+    model, pk = type(instance), instance.pk
+    if sync:
+        store_renditions(model, pk, field_name, source, render(source_path, output_dir))
+        return
+
+    def done(future):
+        try:
+            store_renditions(model, pk, field_name, source, future.result())
+        except Exception:
+            logger.exception('Rendering %s for %s %s failed', source, model.__name__, pk)
+
+    get_executor().submit(render, source_path, output_dir).add_done_callback(done)
+
+
+def needs_processing(instance, field_name):
+    image = getattr(instance, field_name)
+    renditions = getattr(instance, f'{field_name}_renditions') or {}
+    return bool(image) and renditions.get('source') != image.name
+
+
+def schedule_renditions(instance, field_name):
+    """Queue rendering after commit if the image changed since the last run."""
+    if needs_processing(instance, field_name):
+        transaction.on_commit(lambda: process_image(instance, field_name))
+
+
+def rendition_urls(renditions, request=None):
+    """Serializer helper: public URL, width, height and format of each rendition."""
+    items = (renditions or {}).get('items', [])
+    result = []
+    for item in items:
+        url = default_storage.url(item['path'])
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        result.append({'url': url, 'width': item['width'], 'height': item['height'], 'format': item['format']})
+    return result
@@ -0,0 +1,350 @@
+"""
+Bulk import of garages, their service prices and their part inventories.
+
+Files are streamed: CSV (header line required), GeoJSON FeatureCollections
+(read feature by feature, never as one document) or newline-delimited
+GeoJSON features. Rows are validated and loaded ``CHUNK_SIZE`` at a time,
+each chunk in its own transaction together with the run's progress, so
+memory stays bounded and a failed run resumes after the last committed
+chunk. Loading is idempotent anyway: garages are upserted on ``ref``
+(``Garage.external_ref``), service prices on (garage, service) and parts on
+(garage, SKU).
+
+Garages go through ``COPY`` into a temporary table and one
+``INSERT ... SELECT ... ON CONFLICT`` that builds the PostGIS points in SQL;
+rows without coordinates are geocoded a chunk at a time first, before the
+chunk's transaction opens. Services and parts reference their garage by
+``garage_ref`` and are written with ``bulk_create(update_conflicts=True)``.
+Model signals do not fire, so the offer projection, map tiles and response
+caches are refreshed per chunk.
+"""
+import codecs
+import csv
+import json
+import logging
+import re
+import threading
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+
+from .cache import bump_namespaces_on_commit
+from .geocoding import address_query, geocode_many
+from .inventory import PART_FIELDS, chunked, validate_rows
+from .models import Garage, GarageService, ImportRun, Part, PartCategory, Service
+from .offers import sync_offers_for_garages
+from .serializers import GarageImportRowSerializer, PartImportRowSerializer, ServiceImportRowSerializer
+from .tiles import invalidate_tiles_on_commit
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2000
+# Rejected rows beyond this are counted but not kept on the run
+MAX_STORED_ERRORS = 1000
+READ_SIZE = 1 << 16
+MAX_FEATURE_SIZE = 1 << 24
+# pg_try_advisory_lock(LOCK_CLASS, run id) keeps two workers off the same run
+LOCK_CLASS = 7301
+
+LINE_SUFFIXES = ('.geojsonl', '.geojsons', '.ndjson', '.jsonl')
+SUFFIXES = ('.csv', '.geojson', '.json', *LINE_SUFFIXES)
+
+FEATURES_START = re.compile(r'"features"\s*:\s*\[')
+SEPARATOR = re.compile(r'[\s,]*')
+
+STAGE_SQL = """
+CREATE TEMPORARY TABLE garage_import_stage (
+    external_ref varchar(64), name varchar(255), description text, address varchar(255),
+    city varchar(100), country varchar(100), phone_number varchar(20), email varchar(254),
+    website varchar(200), is_verified boolean, lon double precision, lat double precision
+) ON COMMIT DROP
+"""
+
+STAGE_COLUMNS = (
+    'external_ref', 'name', 'description', 'address', 'city', 'country',
+    'phone_number', 'email', 'website', 'is_verified', 'lon', 'lat',
+)
+
+COPY_SQL = f"COPY garage_import_stage ({', '.join(STAGE_COLUMNS)}) FROM STDIN"
+
+# The owner only applies to new garages; re-imports leave ownership alone
+UPSERT_SQL = """
+INSERT INTO {garage} (
+    external_ref, owner_id, name, description, address, city, country, phone_number, email, website,
+    is_verified, location, created_at, updated_at, rating_count, rating_sum
+)
+SELECT external_ref, %(owner_id)s, name, description, address, city, country, phone_number, email, website,
+       is_verified, ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography, now(), now(), 0, 0
+FROM garage_import_stage
+ON CONFLICT (external_ref) DO UPDATE SET
+    name = EXCLUDED.name, description = EXCLUDED.description, address = EXCLUDED.address,
+    city = EXCLUDED.city, country = EXCLUDED.country, phone_number = EXCLUDED.phone_number,
+    email = EXCLUDED.email, website = EXCLUDED.website, is_verified = EXCLUDED.is_verified,
+    location = EXCLUDED.location, updated_at = EXCLUDED.updated_at
+RETURNING id
+"""
+
+
+class ImportFormatError(Exception):
+    """The file cannot be read as the format its extension promises."""
+
+
+class ImportBusy(Exception):
+    """Another worker is already running this import."""
+
+
+def iter_features(fh):
+    """Features of a GeoJSON FeatureCollection one at a time, reading ``READ_SIZE`` characters at once."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while (match := FEATURES_START.search(buffer)) is None:
+        chunk = fh.read(READ_SIZE)
+        if not chunk:
+            raise ImportFormatError('No "features" array found.')
+        # Keep a tail in case the key straddles two reads
+        buffer = buffer[-32:] + chunk
+    buffer, pos, eof = buffer[match.end():], 0, False
+    while True:
+        pos = SEPARATOR.match(buffer, pos).end()
+        if buffer.startswith(']', pos):
+            return
+        if pos < len(buffer):
+            try:
+                feature, pos = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # Usually a feature cut off by the end of the buffer
+                if eof or len(buffer) - pos > MAX_FEATURE_SIZE:
+                    raise ImportFormatError('Malformed or truncated GeoJSON.') from None
+            else:
+                yield feature
+                continue
+        elif eof:
+            raise ImportFormatError('Truncated GeoJSON: the "features" array is not closed.')
+        chunk = fh.read(READ_SIZE)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def feature_row(feature):
+    """Flatten a feature into an import row: its properties plus ``lat``/``lon``."""
+    if not isinstance(feature, dict):
+        return feature
+    row = dict(feature.get('properties') or {})
+    geometry = feature.get('geometry')
+    if geometry:
+        row['geometry_type'] = geometry.get('type')
+        coordinates = geometry.get('coordinates')
+        if row['geometry_type'] == 'Point' and coordinates and len(coordinates) >= 2:
+            row['lon'], row['lat'] = coordinates[:2]
+    return row
+
+
+def _load_line(line):
+    try:
+        return feature_row(json.loads(line))
+    except ValueError:
+        # Reported by the row serializer, like NDJSONParser does
+        return line.strip()
+
+
+def check_source(path):
+    suffix = Path(path).suffix.lower()
+    if suffix not in SUFFIXES:
+        raise ImportFormatError(f'Unsupported file type "{suffix}"; use .csv, .geojson or .geojsonl.')
+    return suffix
+
+
+def read_rows(path):
+    """Lazily yield the rows of ``path``, picking the format from its extension."""
+    suffix = check_source(path)
+    with open(path, 'rb') as fh:
+        if suffix == '.csv':
+            for row in csv.DictReader(codecs.iterdecode(fh, 'utf-8-sig')):
+                yield {key: value for key, value in row.items() if key and value not in ('', None)}
+        elif suffix in LINE_SUFFIXES:
+            for line in codecs.iterdecode(fh, 'utf-8-sig'):
+                # GeoJSON text sequences prefix each record with RS
+                if line.strip(' \t\r\n\x1e'):
+                    yield _load_line(line.strip('\x1e'))
+        else:
+            for feature in iter_features(codecs.getreader('utf-8-sig')(fh)):
+                yield feature_row(feature)
+
+
+def _reject(errors, number, field, message):
+    errors.append({'row': number, 'errors': {field: [message]}})
+
+
+def locate_garages(rows, errors):
+    """
+    Fill in coordinates for rows without them; rows that cannot be geocoded are
+    rejected. Runs before the chunk's transaction so no locks are held while
+    the geocoder is called.
+    """
+    queries = {number: address_query(data['address'], data['city'], data['country'])
+               for number, data in rows if 'lat' not in data}
+    points = geocode_many(list(set(queries.values()))) if queries else {}
+    located = []
+    for number, data in rows:
+        if number in queries:
+            point = points[queries[number]]
+            if point is None:
+                _reject(errors, number, 'address', f'Could not geocode "{queries[number]}".')
+                continue
+            data['lon'], data['lat'] = point.x, point.y
+        located.append((number, data))
+    return located
+
+
+def load_garages(run, rows, errors, context):
+    # Later rows for the same ref win; ON CONFLICT cannot touch a row twice in one statement
+    by_ref = {data['ref']: data for number, data in rows}
+    if not by_ref:
+        return
+    previous = list(Garage.objects.filter(external_ref__in=list(by_ref), is_verified=True)
+                    .values_list('location', flat=True))
+    with connection.cursor() as cursor:
+        cursor.execute(STAGE_SQL)
+        with cursor.copy(COPY_SQL) as copy:
+            for ref, data in by_ref.items():
+                copy.write_row([ref, *(data[column] for column in STAGE_COLUMNS[1:])])
+        cursor.execute(UPSERT_SQL.format(garage=connection.ops.quote_name(Garage._meta.db_table)),
+                       {'owner_id': run.owner_id})
+        garage_ids = [row[0] for row in cursor.fetchall()]
+        # ON COMMIT DROP alone is not enough when chunks share an outer transaction
+        cursor.execute('DROP TABLE garage_import_stage')
+    sync_offers_for_garages(garage_ids)
+    invalidate_tiles_on_commit(previous + [Point(data['lon'], data['lat'], srid=4326)
+                                           for data in by_ref.values() if data['is_verified']])
+    bump_namespaces_on_commit(('garages',))
+
+
+def _garage_ids(rows, errors):
+    """Resolve ``garage_ref`` for every row; rows naming an unknown garage are rejected."""
+    garages = dict(Garage.objects.filter(external_ref__in={data['garage_ref'] for _, data in rows})
+                   .values_list('external_ref', 'id'))
+    resolved = []
+    for number, data in rows:
+        garage_id = garages.get(data.pop('garage_ref'))
+        if garage_id is None:
+            _reject(errors, number, 'garage_ref', 'Unknown garage.')
+            continue
+        resolved.append((number, garage_id, data))
+    return resolved
+
+
+def load_services(run, rows, errors, context):
+    if 'services' not in context:
+        context['services'] = dict(Service.objects.values_list('name', 'id'))
+    prices = {}
+    for number, garage_id, data in _garage_ids(rows, errors):
+        service_id = context['services'].get(data['service'])
+        if service_id is None:
+            _reject(errors, number, 'service', f'Unknown service "{data["service"]}".')
+            continue
+        prices[garage_id, service_id] = data['price']
+    if not prices:
+        return
+    GarageService.objects.bulk_create(
+        [GarageService(garage_id=garage_id, service_id=service_id, price=price)
+         for (garage_id, service_id), price in prices.items()],
+        update_conflicts=True, unique_fields=['garage', 'service'], update_fields=['price'],
+    )
+    sync_offers_for_garages({garage_id for garage_id, _ in prices})
+    bump_namespaces_on_commit(('garages',))
+
+
+def load_parts(run, rows, errors, context):
+    if 'categories' not in context:
+        context['categories'] = dict(PartCategory.objects.values_list('slug', 'id'))
+    parts = {}
+    for number, garage_id, data in _garage_ids(rows, errors):
+        slug = data.pop('category', None)
+        if slug is not None and slug not in context['categories']:
+            _reject(errors, number, 'category', f'Unknown category "{slug}".')
+            continue
+        parts[garage_id, data['sku']] = Part(seller_garage_id=garage_id, category_id=context['categories'].get(slug), **data)
+    if not parts:
+        return
+    Part.objects.bulk_create(
+        list(parts.values()), update_conflicts=True,
+        unique_fields=['seller_garage', 'sku'], update_fields=list(PART_FIELDS),
+    )
+    bump_namespaces_on_commit(('parts',))
+
+
+# kind: (row serializer, prepare(rows, errors) run outside the transaction or None, loader)
+LOADERS = {
+    ImportRun.Kind.GARAGES: (GarageImportRowSerializer, locate_garages, load_garages),
+    ImportRun.Kind.SERVICES: (ServiceImportRowSerializer, None, load_services),
+    ImportRun.Kind.PARTS: (PartImportRowSerializer, None, load_parts),
+}
+
+
+class _RunLock:
+    """Session-level advisory lock on one run; released if the worker dies."""
+    def __init__(self, run):
+        self.key = (LOCK_CLASS, run.pk)
+
+    def __enter__(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', self.key)
+            if not cursor.fetchone()[0]:
+                raise ImportBusy(f'Import {self.key[1]} is already running.')
+
+    def __exit__(self, *exc_info):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)', self.key)
+
+
+def run_import(run, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Load ``run.source`` from where the run last stopped. ``progress(run, rows_per_second)``
+    is called after every committed chunk. Returns the run; on error it is saved
+    as failed and the exception re-raised.
+    """
+    serializer_class, prepare, load = LOADERS[run.kind]
+    with _RunLock(run):
+        run.refresh_from_db()
+        if run.status == ImportRun.Status.DONE:
+            return run
+        run.status, run.message = ImportRun.Status.RUNNING, ''
+        run.save(update_fields=['status', 'message', 'updated_at'])
+        context, started, resumed_at = {}, time.monotonic(), run.rows_done
+        try:
+            rows = islice(read_rows(run.source), run.rows_done, None)
+            for chunk in chunked(rows, chunk_size):
+                errors = []
+                valid = list(validate_rows(chunk, serializer_class, errors, run.rows_done + 1))
+                if prepare is not None:
+                    valid = prepare(valid, errors)
+                with transaction.atomic():
+                    load(run, valid, errors, context)
+                    run.rows_done += len(chunk)
+                    run.rows_failed += len(errors)
+                    run.errors = (run.errors + sorted(errors, key=lambda error: error['row']))[:MAX_STORED_ERRORS]
+                    run.save(update_fields=['rows_done', 'rows_failed', 'errors', 'updated_at'])
+                if progress is not None:
+                    progress(run, (run.rows_done - resumed_at) / max(time.monotonic() - started, 1e-6))
+        except Exception as exc:
+            run.status, run.message = ImportRun.Status.FAILED, f'{type(exc).__name__}: {exc}'
+            run.save(update_fields=['status', 'message', 'updated_at'])
+            raise
+        run.status = ImportRun.Status.DONE
+        run.save(update_fields=['status', 'updated_at'])
+    return run
+
+
+def start_import(run):
+    """``run_import`` on a background thread, for callers that cannot wait (the admin)."""
+    def target():
+        try:
+            run_import(run)
+        except Exception:
+            logger.exception('Import %s failed', run.pk)
+        finally:
+            connection.close()
+    threading.Thread(target=target, name=f'import-{run.pk}', daemon=True).start()
@@ -0,0 +1,124 @@
+"""
+Bulk inventory sync for a single garage: parts keyed by SKU and service
+prices keyed by service name. Rows are validated one by one (errors are
+reported per row, valid rows still apply) and written in chunks with
+``bulk_update`` / ``bulk_create(update_conflicts=True)`` inside one
+transaction.
+"""
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_namespaces_on_commit
+from .models import GarageService, Part, PartCategory, Service
+from .offers import sync_garage_offers
+from .serializers import PartInventoryRowSerializer, ServicePriceRowSerializer
+
+CHUNK_SIZE = 1000
+PART_FIELDS = ('name', 'description', 'category', 'price', 'stock', 'is_available', 'updated_at')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def validate_rows(rows, serializer_class, errors, start):
+    """Yield ``(row_number, validated_data)``; invalid rows are appended to ``errors``."""
+    for number, row in enumerate(rows, start=start):
+        serializer = serializer_class(data=row)
+        if serializer.is_valid():
+            yield number, serializer.validated_data
+        else:
+            errors.append({'row': number, 'errors': serializer.errors})
+
+
+class BulkResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'errors': self.errors}
+
+
+def upsert_parts(garage, rows, chunk_size=CHUNK_SIZE):
+    result = BulkResult()
+    categories = dict(PartCategory.objects.values_list('slug', 'id'))
+    with transaction.atomic():
+        for index, chunk in enumerate(chunked(rows, chunk_size)):
+            valid = list(validate_rows(chunk, PartInventoryRowSerializer, result.errors, index * chunk_size + 1))
+            _upsert_part_chunk(garage, valid, categories, result)
+        bump_namespaces_on_commit(('parts',))
+    return result
+
+
+def _upsert_part_chunk(garage, rows, categories, result):
+    # Later rows for the same SKU win, as if the rows had been sent one by one
+    by_sku = {}
+    for number, data in rows:
+        if 'category' in data:
+            slug = data.pop('category')
+            if slug is not None and slug not in categories:
+                result.errors.append({'row': number, 'errors': {'category': [f'Unknown category "{slug}".']}})
+                continue
+            data['category_id'] = categories.get(slug)
+        by_sku[data.pop('sku')] = (number, data)
+
+    existing = {part.sku: part for part in Part.objects.filter(seller_garage=garage, sku__in=list(by_sku))}
+    to_update, to_create, update_fields = [], [], set()
+    now = timezone.now()
+    for sku, (number, data) in by_sku.items():
+        part = existing.get(sku)
+        if part is not None:
+            for field, value in data.items():
+                setattr(part, field, value)
+            update_fields.update('category' if field == 'category_id' else field for field in data)
+            # bulk_update() does not run auto_now
+            part.updated_at = now
+            to_update.append(part)
+        elif 'name' in data and 'price' in data:
+            to_create.append(Part(seller_garage=garage, sku=sku, description=data.pop('description', ''), **data))
+        else:
+            result.errors.append({'row': number, 'errors': {'non_field_errors': ['New parts need a name and a price.']}})
+
+    if to_update and update_fields:
+        Part.objects.bulk_update(to_update, sorted(update_fields | {'updated_at'}))
+    if to_create:
+        # update_conflicts covers a concurrent sync inserting the same SKU first
+        Part.objects.bulk_create(
+            to_create, update_conflicts=True,
+            unique_fields=['seller_garage', 'sku'], update_fields=list(PART_FIELDS),
+        )
+    result.updated += len(to_update)
+    result.created += len(to_create)
+
+
+def upsert_service_prices(garage, rows, chunk_size=CHUNK_SIZE):
+    result = BulkResult()
+    services = dict(Service.objects.values_list('name', 'id'))
+    offered = set(GarageService.objects.filter(garage=garage).values_list('service_id', flat=True))
+    with transaction.atomic():
+        for index, chunk in enumerate(chunked(rows, chunk_size)):
+            prices = {}
+            for number, data in validate_rows(chunk, ServicePriceRowSerializer, result.errors, index * chunk_size + 1):
+                service_id = services.get(data['service'])
+                if service_id is None:
+                    result.errors.append({'row': number, 'errors': {'service': [f'Unknown service "{data["service"]}".']}})
+                    continue
+                prices[service_id] = data['price']
+            GarageService.objects.bulk_create(
+                [GarageService(garage=garage, service_id=service_id, price=price) for service_id, price in prices.items()],
+                update_conflicts=True, unique_fields=['garage', 'service'], update_fields=['price'],
+            )
+            updated = offered.intersection(prices)
+            result.updated += len(updated)
+            result.created += len(prices) - len(updated)
+            offered.update(prices)
+        # bulk_create skips the GarageService signals that maintain the projection
+        sync_garage_offers(garage)
+        bump_namespaces_on_commit(('garages',))
+    return result
@@ -0,0 +1,194 @@
+"""
+Server-Sent Events push for the forum, served by the ASGI application.
+
+Each process runs one feed task per event loop, and only while somebody is
+listening. Every ``POLL_INTERVAL`` it reads new posts and threads by
+ascending id, then fans them out to the local subscribers. The cost is two
+small indexed queries per process, however many clients are connected, and
+it sees writes from every worker, WSGI or ASGI. An event is serialized once
+and the same bytes go to every subscriber.
+
+Posts are published on a per-thread channel and new threads on ``THREADS``.
+Event ids are row ids, so a client that reconnects with ``Last-Event-ID``
+(or ``?last_event_id=``) is first sent what it missed.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from collections import defaultdict, deque
+
+from .models import ForumPost, ForumThread
+from .renderers import FastJSONRenderer
+from .serializers import ForumPostSerializer, ForumThreadSerializer
+
+logger = logging.getLogger(__name__)
+
+THREADS = 'threads'
+POLL_INTERVAL = 1.0
+# Rows committed out of id order by concurrent transactions are still picked
+# up if they become visible within this many seconds
+REORDER_WINDOW = 5.0
+KEEPALIVE = 15
+QUEUE_SIZE = 100
+CATCH_UP_LIMIT = 1000
+RETRY_MS = 3000
+
+
+def frame(event, event_id, data):
+    payload = FastJSONRenderer().render(data).decode()
+    return f'id: {event_id}\nevent: {event}\ndata: {payload}\n\n'.encode()
+
+
+class Tail:
+    """New rows of ``queryset`` in id order, tolerant of late commits."""
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.cursor = 0
+        self.checkpoints = deque()
+        self.seen = set()
+
+    async def start(self):
+        self.cursor = await self.queryset.order_by('-id').values_list('id', flat=True).afirst() or 0
+
+    async def poll(self):
+        now = time.monotonic()
+        self.checkpoints.append((now, self.cursor))
+        while len(self.checkpoints) > 1 and self.checkpoints[1][0] <= now - REORDER_WINDOW:
+            self.checkpoints.popleft()
+        # Re-read from where the cursor stood REORDER_WINDOW ago; ids already sent are skipped
+        watermark = self.checkpoints[0][1]
+        rows = [row async for row in self.queryset.filter(id__gt=watermark).order_by('id')]
+        fresh = [row for row in rows if row.pk not in self.seen]
+        self.seen = {pk for pk in self.seen if pk > watermark} | {row.pk for row in fresh}
+        if rows:
+            self.cursor = max(self.cursor, rows[-1].pk)
+        return fresh
+
+
+class ForumFeed:
+    def __init__(self):
+        # channel -> subscriber queues of (event id, frame) or None once dropped
+        self.subscribers = defaultdict(set)
+        self.ready = asyncio.Event()
+        self.task = None
+
+    def subscribe(self, channel):
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.subscribers[channel].add(queue)
+        if self.task is None or self.task.done():
+            self.ready.clear()
+            self.task = asyncio.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        queues = self.subscribers.get(channel)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[channel]
+
+    def publish(self, channel, event_id, chunk):
+        for queue in list(self.subscribers.get(channel, ())):
+            try:
+                queue.put_nowait((event_id, chunk))
+            except asyncio.QueueFull:
+                # Slow reader: cut it loose; it reconnects with Last-Event-ID and catches up
+                self.unsubscribe(channel, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def drop_all(self):
+        for channel, queues in list(self.subscribers.items()):
+            for queue in list(queues):
+                self.unsubscribe(channel, queue)
+                queue.put_nowait(None)
+
+    async def run(self):
+        posts = Tail(ForumPost.objects.select_related('author'))
+        threads = Tail(ForumThread.objects.select_related('author', 'last_poster'))
+        try:
+            await posts.start()
+            await threads.start()
+        except Exception:
+            logger.exception('Forum feed failed to start')
+            self.drop_all()
+            return
+        finally:
+            # Subscribers catch up from the database after this point, so nothing falls in between
+            self.ready.set()
+        while self.subscribers:
+            await asyncio.sleep(POLL_INTERVAL)
+            try:
+                for post in await posts.poll():
+                    if post.thread_id in self.subscribers:
+                        self.publish(post.thread_id, post.pk, frame('post', post.pk, ForumPostSerializer(post).data))
+                for thread in await threads.poll():
+                    if THREADS in self.subscribers:
+                        self.publish(THREADS, thread.pk, frame('thread', thread.pk, ForumThreadSerializer(thread).data))
+            except Exception:
+                logger.exception('Forum feed poll failed')
+
+
+_feeds = weakref.WeakKeyDictionary()
+
+
+def get_feed():
+    loop = asyncio.get_running_loop()
+    feed = _feeds.get(loop)
+    if feed is None:
+        feed = _feeds[loop] = ForumFeed()
+    return feed
+
+
+async def catch_up(queryset, last_id, event, serializer_class):
+    """Yield ``(id, frame)`` for rows after ``last_id``; a ``reset`` event if too far behind."""
+    rows = [row async for row in queryset.filter(id__gt=last_id).order_by('id')[:CATCH_UP_LIMIT + 1]]
+    if len(rows) > CATCH_UP_LIMIT:
+        # Too far behind to replay; the client should reload over the REST API
+        yield None, b'event: reset\ndata: {}\n\n'
+        return
+    for row in rows:
+        yield row.pk, frame(event, row.pk, serializer_class(row).data)
+
+
+async def event_stream(channel, history, last_id):
+    """
+    SSE body for one subscriber. ``history(last_id)`` is the catch-up
+    generator for the channel.
+    """
+    feed = get_feed()
+    queue = feed.subscribe(channel)
+    try:
+        await feed.ready.wait()
+        yield f'retry: {RETRY_MS}\n\n'.encode()
+        replayed = set()
+        if last_id is not None:
+            async for event_id, chunk in history(last_id):
+                replayed.add(event_id)
+                yield chunk
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            if item is None:
+                return
+            event_id, chunk = item
+            if event_id not in replayed:
+                yield chunk
+    finally:
+        feed.unsubscribe(channel, queue)
+
+
+def thread_history(last_id):
+    return catch_up(ForumThread.objects.select_related('author', 'last_poster'), last_id, 'thread', ForumThreadSerializer)
+
+
+def post_history(thread_id):
+    def history(last_id):
+        posts = ForumPost.objects.filter(thread_id=thread_id).select_related('author')
+        return catch_up(posts, last_id, 'post', ForumPostSerializer)
+    return history
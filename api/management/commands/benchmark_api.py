@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api import benchmark
+from api.models import Garage
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with realistic volumes, hit every API route and "
+        "report query counts, p50/p95 latency and response size. Fails if any route "
+        "exceeds its query budget. Point DATABASE_URL at a local PostGIS container to run offline."
+    )
+
+    def add_arguments(self, parser):
+        volume = benchmark.Volume()
+        for name in volume.__dataclass_fields__:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=getattr(volume, name))
+        parser.add_argument('--repeats', type=int, default=20, help="Requests per route.")
+        parser.add_argument('--keepdb', action='store_true', help="Reuse and keep the test database.")
+        parser.add_argument('--json', dest='json_path', help="Also write the measurements to this file.")
+
+    def handle(self, *args, **options):
+        volume = benchmark.Volume(**{name: options[name] for name in benchmark.Volume.__dataclass_fields__})
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not options['keepdb'] or not Garage.objects.exists():
+                self.stdout.write(f"Seeding {volume} ...")
+                benchmark.seed(volume)
+            measurements = benchmark.run(Client(), repeats=options['repeats'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.stdout.write(benchmark.format_report(measurements))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump([{
+                    'endpoint': m.endpoint.name, 'url': m.endpoint.url, 'queries': m.queries,
+                    'query_budget': m.endpoint.query_budget, 'p50_ms': m.p50_ms, 'p95_ms': m.p95_ms,
+                    'response_bytes': m.response_bytes,
+                } for m in measurements], fh, indent=2)
+        over = [m.endpoint.name for m in measurements if m.over_budget]
+        if over:
+            raise CommandError(f"Query budget exceeded: {', '.join(over)}")
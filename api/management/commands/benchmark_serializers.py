@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api import benchmark
+from api.models import Garage
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark: per-row cost of the DRF serializers against their compiled read "
+        "path (api.fastpath) and of JSON rendering with and without orjson, on a seeded "
+        "throwaway test database. Fails if the compiled output is not identical."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help="Rows serialized per run.")
+        parser.add_argument('--repeats', type=int, default=5, help="Runs per measurement; the best one counts.")
+        parser.add_argument('--keepdb', action='store_true', help="Reuse and keep the test database.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not options['keepdb'] or not Garage.objects.exists():
+                volume = benchmark.Volume()
+                self.stdout.write(f"Seeding {volume} ...")
+                benchmark.seed(volume)
+            timings = benchmark.time_serializers(rows=options['rows'], repeats=options['repeats'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        self.stdout.write(benchmark.format_serializer_report(timings))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api.images import get_executor, needs_processing, process_image
+from api.models import Part, Profile
+
+TARGETS = {
+    'parts': (Part, 'image'),
+    'profiles': (Profile, 'profile_picture'),
+}
+
+
+class Command(BaseCommand):
+    help = "Render missing or stale thumbnails/WebP renditions for part images and profile pictures."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=sorted(TARGETS), help="Limit to one kind of image.")
+        parser.add_argument('--sync', action='store_true',
+                            help="Render in this process instead of the background pool.")
+
+    def handle(self, *args, only=None, sync=False, **options):
+        total = 0
+        for name, (model, field_name) in TARGETS.items():
+            if only and name != only:
+                continue
+            queued = 0
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for instance in queryset.only('pk', field_name, f'{field_name}_renditions').iterator():
+                if needs_processing(instance, field_name):
+                    process_image(instance, field_name, sync=sync)
+                    queued += 1
+            total += queued
+            self.stdout.write(f"{name}: {queued} images {'rendered' if sync else 'queued'}")
+        if not sync and total:
+            # Wait for the pool so results are stored before the command exits
+            get_executor().shutdown(wait=True)
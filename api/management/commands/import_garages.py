@@ -0,0 +1,67 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import CHUNK_SIZE, ImportBusy, ImportFormatError, check_source, run_import
+from api.models import ImportRun
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk load garages, service prices or part inventories from a CSV, GeoJSON or "
+        "newline-delimited GeoJSON file. Services and parts name their garage by garage_ref. "
+        "Progress is committed per chunk; rerun with --resume <run id> after a failure."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?')
+        parser.add_argument('--kind', choices=ImportRun.Kind.values, default=ImportRun.Kind.GARAGES)
+        parser.add_argument('--owner', help="Username that owns newly created garages.")
+        parser.add_argument('--resume', type=int, metavar='RUN_ID', help="Continue a failed or interrupted run.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                run = ImportRun.objects.get(pk=options['resume'])
+            except ImportRun.DoesNotExist:
+                raise CommandError(f"No import run {options['resume']}.")
+        else:
+            run = self.create_run(options)
+
+        self.stdout.write(f"Import {run.pk}: {run} (starting at row {run.rows_done + 1})")
+        try:
+            run_import(run, chunk_size=options['chunk_size'], progress=self.report)
+        except (ImportBusy, ImportFormatError) as exc:
+            raise CommandError(str(exc))
+        except Exception as exc:
+            raise CommandError(f"{exc}\nFixed the cause? Resume with --resume {run.pk}.") from exc
+        for error in run.errors[:20]:
+            self.stdout.write(self.style.WARNING(f"Row {error['row']}: {error['errors']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {run.rows_done - run.rows_failed} of {run.rows_done} rows; {run.rows_failed} rejected."
+        ))
+
+    def create_run(self, options):
+        path = options['path']
+        if not path:
+            raise CommandError("Give a file to import or --resume <run id>.")
+        if not os.path.isfile(path):
+            raise CommandError(f"No such file: {path}")
+        try:
+            check_source(path)
+        except ImportFormatError as exc:
+            raise CommandError(str(exc))
+        owner = None
+        if options['kind'] == ImportRun.Kind.GARAGES:
+            if not options['owner']:
+                raise CommandError("Garage imports need --owner for the garages they create.")
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user {options['owner']}.")
+        return ImportRun.objects.create(kind=options['kind'], source=os.path.abspath(path), owner=owner)
+
+    def report(self, run, rate):
+        self.stdout.write(f"  {run.rows_done} rows, {run.rows_failed} rejected, {rate:.0f} rows/s")
@@ -0,0 +1,60 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import percentile
+
+DEFAULT_TARGETS = [
+    'wsgi-garages=http://127.0.0.1:8000/api/garages/',
+    'asgi-garages=http://127.0.0.1:8001/api/async/garages/',
+    'wsgi-parts=http://127.0.0.1:8000/api/parts/',
+    'asgi-parts=http://127.0.0.1:8001/api/async/parts/',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and latency of running servers, e.g. the WSGI routes under "
+        "gunicorn on :8000 against the async routes under uvicorn on :8001. Each target "
+        "is label=url."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=2000, dest='total')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, targets, concurrency, total, timeout, **options):
+        self.stdout.write(f"{'target':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for target in targets:
+            label, sep, url = target.partition('=')
+            if not sep:
+                raise CommandError(f"Target {target!r} must be label=url")
+            rps, p50, p95, errors = self.run_target(url, concurrency, total, timeout)
+            self.stdout.write(f'{label:<16} {rps:>8.1f} {p50:>8.1f} {p95:>8.1f} {errors:>7}')
+
+    def run_target(self, url, concurrency, total, timeout):
+        local = threading.local()
+
+        def fetch(_):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            start = time.perf_counter()
+            try:
+                ok = session.get(url, timeout=timeout).status_code == 200
+            except requests.RequestException:
+                ok = False
+            return (time.perf_counter() - start) * 1000, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, range(total)))
+        elapsed = time.perf_counter() - started
+        timings = [ms for ms, _ in results]
+        errors = sum(1 for _, ok in results if not ok)
+        return total / elapsed, percentile(timings, 50), percentile(timings, 95), errors
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Garage
+from api.ratings import rebuild_rating_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized rating count, sum and average on every garage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--garage', type=int, action='append', dest='garage_ids',
+                            help="Only rebuild the given garage id (may be repeated).")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of garages updated per statement.")
+
+    def handle(self, *args, garage_ids=None, batch_size=5000, **options):
+        ids = Garage.objects.order_by('pk').values_list('pk', flat=True)
+        if garage_ids:
+            ids = ids.filter(pk__in=garage_ids)
+        ids = list(ids)
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            with transaction.atomic():
+                updated += rebuild_rating_stats(Garage.objects.filter(pk__in=chunk))
+        self.stdout.write(self.style.SUCCESS(f"Corrected rating stats on {updated} garages."))
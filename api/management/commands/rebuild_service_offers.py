@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.offers import rebuild_offers
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ServiceOffer search projection from GarageService and Garage."
+
+    def handle(self, *args, **options):
+        written = rebuild_offers()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} service offers."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.stock import RELEASE_BATCH_SIZE, release_expired
+
+
+class Command(BaseCommand):
+    help = "Return stock held by expired part reservations. Safe to run from several workers at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RELEASE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        total = 0
+        while released := release_expired(batch_size=options['batch_size']):
+            total += released
+        self.stdout.write(self.style.SUCCESS(f"Released {total} reserved units."))
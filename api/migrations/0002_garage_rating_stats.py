@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import Avg, Count, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Garage = apps.get_model('api', 'Garage')
+    Review = apps.get_model('api', 'Review')
+    reviews = Review.objects.filter(garage=OuterRef('pk')).order_by().values('garage')
+    Garage.objects.update(
+        rating_count=Coalesce(Subquery(reviews.annotate(c=Count('pk')).values('c'), output_field=IntegerField()), Value(0)),
+        rating_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s'), output_field=IntegerField()), Value(0)),
+        average_rating=Subquery(reviews.annotate(a=Avg('rating', output_field=FloatField())).values('a'), output_field=FloatField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='garage',
+            name='average_rating',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='garage',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='garage',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
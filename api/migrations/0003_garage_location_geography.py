@@ -0,0 +1,17 @@
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_garage_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='garage',
+            name='location',
+            field=django.contrib.gis.db.models.fields.PointField(geography=True, srid=4326),
+        ),
+    ]
@@ -0,0 +1,72 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+PART_SEARCH_TRIGGER = """
+CREATE OR REPLACE FUNCTION api_part_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(
+            (SELECT name FROM api_partcategory WHERE id = NEW.category_id), '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_part_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description, category_id ON api_part
+    FOR EACH ROW EXECUTE FUNCTION api_part_search_vector_update();
+
+CREATE OR REPLACE FUNCTION api_partcategory_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    -- Touch the parts so their own trigger re-reads the renamed category
+    UPDATE api_part SET name = name WHERE category_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_partcategory_search_vector_trigger
+    AFTER UPDATE OF name ON api_partcategory
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION api_partcategory_search_vector_update();
+
+UPDATE api_part SET name = name;
+"""
+
+DROP_PART_SEARCH_TRIGGER = """
+DROP TRIGGER IF EXISTS api_partcategory_search_vector_trigger ON api_partcategory;
+DROP FUNCTION IF EXISTS api_partcategory_search_vector_update();
+DROP TRIGGER IF EXISTS api_part_search_vector_trigger ON api_part;
+DROP FUNCTION IF EXISTS api_part_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_garage_location_geography'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='part',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='part',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='part_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='part',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='part_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='part',
+            index=models.Index(fields=['price'], name='part_price_idx'),
+        ),
+        migrations.RunSQL(PART_SEARCH_TRIGGER, DROP_PART_SEARCH_TRIGGER),
+    ]
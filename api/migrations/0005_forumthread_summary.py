@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Left
+
+
+def backfill_thread_summary(apps, schema_editor):
+    ForumThread = apps.get_model('api', 'ForumThread')
+    ForumPost = apps.get_model('api', 'ForumPost')
+    posts = ForumPost.objects.filter(thread=OuterRef('pk'))
+    latest = posts.order_by('-created_at', '-id')
+    ForumThread.objects.update(
+        post_count=Coalesce(Subquery(posts.order_by().values('thread').annotate(c=Count('pk')).values('c')), Value(0)),
+        last_post_at=Subquery(latest.values('created_at')[:1]),
+        last_poster=Subquery(latest.values('author')[:1]),
+        last_post_excerpt=Coalesce(Subquery(latest.annotate(e=Left('content', 200)).values('e')[:1]), Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0004_part_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forumthread',
+            name='last_post_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='forumthread',
+            name='last_post_excerpt',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='forumthread',
+            name='last_poster',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='forumthread',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_thread_summary, migrations.RunPython.noop),
+    ]
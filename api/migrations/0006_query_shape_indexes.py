@@ -0,0 +1,36 @@
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_forumthread_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='garage',
+            index=models.Index(condition=models.Q(('is_verified', True)), fields=['id'], name='garage_verified_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='garage',
+            index=models.Index(django.db.models.functions.text.Upper('city'), condition=models.Q(('is_verified', True)), name='garage_verified_city_upper'),
+        ),
+        migrations.AddIndex(
+            model_name='part',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['id'], name='part_available_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['garage', 'created_at', 'id'], name='review_garage_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forumthread',
+            index=models.Index(fields=['created_at', 'id'], name='forumthread_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forumpost',
+            index=models.Index(fields=['thread', 'created_at', 'id'], name='forumpost_thread_created_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='part',
+            constraint=models.UniqueConstraint(fields=('seller_garage', 'sku'), name='part_unique_seller_sku'),
+        ),
+    ]
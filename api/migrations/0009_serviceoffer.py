@@ -0,0 +1,42 @@
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_offers(apps, schema_editor):
+    GarageService = apps.get_model('api', 'GarageService')
+    ServiceOffer = apps.get_model('api', 'ServiceOffer')
+    services = GarageService.objects.filter(garage__is_verified=True).select_related('garage').order_by('id')
+    batch = []
+    for gs in services.iterator(chunk_size=2000):
+        batch.append(ServiceOffer(garage_service_id=gs.pk, service_id=gs.service_id, garage_id=gs.garage_id,
+                                  price=gs.price, location=gs.garage.location))
+        if len(batch) == 2000:
+            ServiceOffer.objects.bulk_create(batch)
+            batch = []
+    ServiceOffer.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_part_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceOffer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('location', django.contrib.gis.db.models.fields.PointField(geography=True, srid=4326)),
+                ('garage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.garage')),
+                ('garage_service', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='offer', to='api.garageservice')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.service')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['service', 'price', 'id'], name='serviceoffer_service_price_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_offers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+# Existing rows start from their creation time; parts have none, so they keep
+# the migration time.
+BACKFILL = [
+    'UPDATE api_garage SET updated_at = created_at;',
+    'UPDATE api_review SET updated_at = created_at;',
+    'UPDATE api_forumpost SET updated_at = created_at;',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_serviceoffer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='garage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='part',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='forumpost',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
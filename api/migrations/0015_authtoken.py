@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Existing rest_framework.authtoken keys keep working: only their digests are copied over
+COPY_TOKENS = """
+INSERT INTO api_authtoken (digest, user_id, created)
+SELECT encode(sha256(convert_to(key, 'UTF8')), 'hex'), user_id, created FROM authtoken_token
+"""
+
+
+def copy_existing_tokens(apps, schema_editor):
+    connection = schema_editor.connection
+    if 'authtoken_token' in connection.introspection.table_names():
+        schema_editor.execute(COPY_TOKENS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_stockreservation_sold_out'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='auth_token', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(copy_existing_tokens, migrations.RunPython.noop),
+    ]
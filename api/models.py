@@ -1,9 +1,13 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Upper
 
 # Create your models here.
 
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models as gis_models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 class Profile(models.Model):
     class UserType(models.TextChoices):
@@ -13,8 +17,20 @@ class Profile(models.Model):
     user_type = models.CharField(max_length=5, choices=UserType.choices, default=UserType.CAR_OWNER)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    # Resized WebP/AVIF copies, filled in the background by api.images
+    profile_picture_renditions = models.JSONField(default=dict, blank=True, editable=False)
     def __str__(self): return f"{self.user.username}'s Profile"
 
+class AuthToken(models.Model):
+    # API token kept only as the SHA-256 digest of its key (api.authentication);
+    # the raw key is handed out once, when issued, and stored nowhere
+    digest = models.CharField(max_length=64, primary_key=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='auth_token')
+    created = models.DateTimeField(auto_now_add=True)
+    # Set on the instance returned by api.authentication.issue_token only
+    key = None
+    def __str__(self): return f"Token for {self.user.username}"
+
 class Garage(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='garages')
     name = models.CharField(max_length=255)
@@ -22,12 +38,27 @@ class Garage(models.Model):
     address = models.CharField(max_length=255)
     city = models.CharField(max_length=100)
     country = models.CharField(max_length=100)
-    location = gis_models.PointField(srid=4326)
+    # geography so the GiST index serves metre-based ST_DWithin, && and <-> (KNN)
+    location = gis_models.PointField(srid=4326, geography=True)
     phone_number = models.CharField(max_length=20)
     email = models.EmailField()
     website = models.URLField(blank=True, null=True)
     is_verified = models.BooleanField(default=False)
+    # Id in the source a garage was bulk imported from; the upsert key for api.imports
+    external_ref = models.CharField(max_length=64, unique=True, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized review aggregates, maintained by api.signals / api.ratings
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(blank=True, null=True)
+    class Meta:
+        indexes = [
+            # Public listings only ever read verified garages
+            models.Index(fields=['id'], name='garage_verified_id_idx', condition=Q(is_verified=True)),
+            # city__iexact compiles to UPPER(city) = UPPER(%s)
+            models.Index(Upper('city'), name='garage_verified_city_upper', condition=Q(is_verified=True)),
+        ]
     def __str__(self): return self.name
 
 class Service(models.Model):
@@ -42,6 +73,21 @@ class GarageService(models.Model):
     class Meta: unique_together = ('garage', 'service')
     def __str__(self): return f"{self.garage.name} - {self.service.name}"
 
+class ServiceOffer(models.Model):
+    """
+    Read-only projection of GarageService rows of verified garages, with the
+    garage location copied in so "service X near me" is a single indexed
+    scan. Maintained incrementally by api.offers.
+    """
+    garage_service = models.OneToOneField(GarageService, on_delete=models.CASCADE, related_name='offer')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='+')
+    garage = models.ForeignKey(Garage, on_delete=models.CASCADE, related_name='+')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    location = gis_models.PointField(srid=4326, geography=True)
+    class Meta:
+        indexes = [models.Index(fields=['service', 'price', 'id'], name='serviceoffer_service_price_idx')]
+    def __str__(self): return f"{self.service_id} @ {self.garage_id}: {self.price}"
+
 class PartCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
@@ -51,27 +97,70 @@ class PartCategory(models.Model):
 class Part(models.Model):
     seller_garage = models.ForeignKey(Garage, on_delete=models.CASCADE, related_name='parts_for_sale')
     category = models.ForeignKey(PartCategory, on_delete=models.SET_NULL, null=True)
+    # Seller's own stock code; the upsert key for bulk inventory sync
+    sku = models.CharField(max_length=64, blank=True, null=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
     image = models.ImageField(upload_to='parts/', blank=True, null=True)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     is_available = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Weighted name/category/description vector, maintained by a database trigger (migration 0004)
+    search_vector = SearchVectorField(null=True, editable=False)
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='part_search_vector_gin'),
+            GinIndex(fields=['name'], name='part_name_trgm', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['price'], name='part_price_idx'),
+            models.Index(fields=['id'], name='part_available_id_idx', condition=Q(is_available=True)),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['seller_garage', 'sku'], name='part_unique_seller_sku'),
+        ]
     def __str__(self): return self.name
 
+class StockReservation(models.Model):
+    # Stock is taken off Part.stock when the hold is placed and handed back if it
+    # expires or is released; rows of one reserve call share a hold id (api.stock)
+    hold = models.UUIDField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    part = models.ForeignKey(Part, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    # This hold took the last units and so switched the part's is_available off
+    sold_out = models.BooleanField(default=False)
+    class Meta:
+        indexes = [
+            models.Index(fields=['hold'], name='reservation_hold_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+    def __str__(self): return f"{self.quantity} x {self.part_id} held by {self.user_id}"
+
 class Review(models.Model):
     garage = models.ForeignKey(Garage, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
     rating = models.PositiveSmallIntegerField(choices=[(i, i) for i in range(1, 6)])
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    class Meta: unique_together = ('garage', 'user')
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        unique_together = ('garage', 'user')
+        indexes = [models.Index(fields=['garage', 'created_at', 'id'], name='review_garage_created_idx')]
     def __str__(self): return f"Review for {self.garage.name} by {self.user.username}"
 
 class ForumThread(models.Model):
     title = models.CharField(max_length=255)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='forum_threads')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized activity summary, maintained by api.signals / api.forum
+    post_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(blank=True, null=True)
+    last_poster = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    last_post_excerpt = models.CharField(max_length=200, blank=True)
+    class Meta:
+        indexes = [models.Index(fields=['created_at', 'id'], name='forumthread_created_idx')]
     def __str__(self): return self.title
 
 class ForumPost(models.Model):
@@ -79,4 +168,42 @@ class ForumPost(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='forum_posts')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        indexes = [models.Index(fields=['thread', 'created_at', 'id'], name='forumpost_thread_created_idx')]
     def __str__(self): return f"Post by {self.author.username} in '{self.thread.title}'"
+
+class GeocodedPlace(models.Model):
+    # Persistent geocoder cache (api.geocoding), keyed by a digest of the normalized
+    # query; a NULL location records that the provider found nothing
+    key = models.CharField(max_length=64, unique=True)
+    query = models.TextField()
+    location = gis_models.PointField(srid=4326, blank=True, null=True)
+    provider = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+    def __str__(self): return self.query
+
+class ImportRun(models.Model):
+    # One bulk load file (api.imports). Each chunk commits together with rows_done,
+    # so a failed run resumes after the last chunk that made it in
+    class Kind(models.TextChoices):
+        GARAGES = 'garages', 'Garages'
+        SERVICES = 'services', 'Service prices'
+        PARTS = 'parts', 'Parts'
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        FAILED = 'failed', 'Failed'
+        DONE = 'done', 'Done'
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    source = models.CharField(max_length=500)
+    # Owner given to newly created garages
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    def __str__(self): return f"{self.get_kind_display()} from {self.source}"
@@ -0,0 +1,78 @@
+"""
+Keeps the ServiceOffer projection in step with GarageService and Garage.
+Only verified garages are projected; a row carries the garage's current
+location so price/distance searches never join back to Garage to filter.
+"""
+from django.db import transaction
+
+from .models import GarageService, ServiceOffer
+
+UPDATE_FIELDS = ['service', 'garage', 'price', 'location']
+BATCH_SIZE = 2000
+
+
+def _offers(garage_services):
+    return [
+        ServiceOffer(garage_service_id=gs.pk, service_id=gs.service_id, garage_id=gs.garage_id,
+                     price=gs.price, location=gs.garage.location)
+        for gs in garage_services
+    ]
+
+
+def sync_offer(garage_service):
+    """Project a single GarageService after it was created or its price changed."""
+    garage = garage_service.garage
+    if not garage.is_verified:
+        ServiceOffer.objects.filter(garage_service_id=garage_service.pk).delete()
+        return
+    ServiceOffer.objects.bulk_create(
+        _offers([garage_service]), update_conflicts=True,
+        unique_fields=['garage_service'], update_fields=UPDATE_FIELDS,
+    )
+
+
+def sync_garage_offers(garage):
+    """Re-project every service of one garage, e.g. after it moved or was (un)verified."""
+    with transaction.atomic():
+        if not garage.is_verified:
+            ServiceOffer.objects.filter(garage_id=garage.pk).delete()
+            return
+        services = list(GarageService.objects.filter(garage_id=garage.pk))
+        for gs in services:
+            gs.garage = garage
+        ServiceOffer.objects.bulk_create(
+            _offers(services), update_conflicts=True,
+            unique_fields=['garage_service'], update_fields=UPDATE_FIELDS,
+        )
+
+
+def sync_offers_for_garages(garage_ids):
+    """Bulk ``sync_garage_offers`` for loaders that bypass the model signals."""
+    garage_ids = list(garage_ids)
+    with transaction.atomic():
+        ServiceOffer.objects.filter(garage_id__in=garage_ids, garage__is_verified=False).delete()
+        services = (GarageService.objects.filter(garage_id__in=garage_ids, garage__is_verified=True)
+                    .select_related('garage').only('id', 'service_id', 'garage_id', 'price', 'garage__location'))
+        ServiceOffer.objects.bulk_create(
+            _offers(services), update_conflicts=True,
+            unique_fields=['garage_service'], update_fields=UPDATE_FIELDS, batch_size=BATCH_SIZE,
+        )
+
+
+def rebuild_offers():
+    """Rebuild the whole projection from scratch. Returns the number of rows written."""
+    written = 0
+    with transaction.atomic():
+        ServiceOffer.objects.all().delete()
+        services = (GarageService.objects.filter(garage__is_verified=True)
+                    .select_related('garage').only('id', 'service_id', 'garage_id', 'price', 'garage__location')
+                    .order_by('id'))
+        batch = []
+        for gs in services.iterator(chunk_size=BATCH_SIZE):
+            batch.append(gs)
+            if len(batch) == BATCH_SIZE:
+                written += len(ServiceOffer.objects.bulk_create(_offers(batch)))
+                batch = []
+        if batch:
+            written += len(ServiceOffer.objects.bulk_create(_offers(batch)))
+    return written
@@ -0,0 +1,189 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.contrib.gis.measure import Distance
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset ("seek") pagination.
+
+    The sort key is taken from the queryset's own ``order_by()`` when it has
+    one (so distance- or rating-sorted garages page correctly), otherwise from
+    ``view.ordering``, otherwise from ``self.ordering``. A unique ``id``
+    tie-breaker is appended when missing. The cursor stores the sort values
+    of the last row on the page and the next page is fetched with a
+    ``WHERE (a, id) > (x, y)``-style predicate, so deep pages cost the same
+    as the first one.
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # ?limit=N returns just the top N rows (e.g. the N nearest garages), no cursor
+    limit_query_param = 'limit'
+    ordering = ('-id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async counterpart of ``paginate_queryset`` for the ASGI read path."""
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page([obj async for obj in page_queryset.aiterator(chunk_size=self.page_size + 1)])
+
+    def paginate_values(self, queryset, request, fields, view=None):
+        """
+        ``paginate_queryset`` returning ``values_list(*fields)`` tuples instead of
+        instances (api.fastpath). Sort key columns not among ``fields`` are
+        appended to each row so the next cursor can still be built.
+        """
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        keys = [term.lstrip('-') for term in self.ordering]
+        extra = [key for key in keys if key not in fields]
+        columns = [*fields, *extra]
+        self.key_positions = [columns.index(key) for key in keys]
+        return self.set_page(list(page_queryset.prefetch_related(None).values_list(*columns)))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """Order, seek and slice ``queryset`` to one page plus a look-ahead row, without hitting the DB."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.limit = self.get_limit(request)
+        if self.limit:
+            self.page_size = self.limit
+        self.ordering = self.get_ordering(queryset, view)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.seek_filter(cursor))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size and not self.limit
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_limit(self, request):
+        if self.limit_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.limit_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return None
+
+    def get_ordering(self, queryset, view):
+        ordering = [o for o in queryset.query.order_by if isinstance(o, str)]
+        if not ordering or len(ordering) != len(queryset.query.order_by):
+            ordering = list(getattr(view, 'ordering', None) or self.ordering)
+        names = {o.lstrip('-') for o in ordering}
+        if not names & {'id', 'pk'}:
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return tuple(ordering)
+
+    def seek_filter(self, values):
+        """
+        Build ``(a > x) OR (a = x AND b > y) OR ...`` honouring each
+        column's direction.
+        """
+        condition = Q()
+        equal = Q()
+        for term, value in zip(self.ordering, values):
+            name = term.lstrip('-')
+            lookup = 'lt' if term.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        if isinstance(last, tuple):
+            values = [last[position] for position in self.key_positions]
+        else:
+            values = [getattr(last, term.lstrip('-')) for term in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def encode_cursor(self, values):
+        payload = json.dumps([self._dump_value(v) for v in values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [self._load_value(model, term.lstrip('-'), v) for term, v in zip(self.ordering, values)]
+        except (TypeError, ValueError, ValidationError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _dump_value(value):
+        if isinstance(value, Distance):
+            return value.m
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    @staticmethod
+    def _load_value(model, name, value):
+        if name == 'pk':
+            name = model._meta.pk.name
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations such as ``distance`` round-trip as plain numbers
+            if value is not None and not isinstance(value, (int, float)):
+                raise ValueError
+            return value
+        return field.to_python(value)
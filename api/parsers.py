@@ -0,0 +1,62 @@
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from .renderers import orjson
+
+
+def _encoding(parser_context):
+    return (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+
+
+class FastJSONParser(JSONParser):
+    """``JSONParser`` decoding with orjson when it is installed and the body is UTF-8."""
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None or codecs.lookup(_encoding(parser_context)).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class CSVParser(BaseParser):
+    """
+    Lazily yields one dict per CSV row (header line required). Empty cells
+    are dropped so they read as "not provided" rather than as blank values.
+    """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        lines = codecs.iterdecode(stream, _encoding(parser_context))
+        return (
+            {key: value for key, value in row.items() if key and value not in ('', None)}
+            for row in csv.DictReader(lines)
+        )
+
+
+class NDJSONParser(BaseParser):
+    """
+    Lazily yields one value per non-empty line. A malformed line is yielded
+    as its raw text so the caller can report it as a row error.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        encoding = _encoding(parser_context)
+        return (self._load(line.decode(encoding)) for line in stream if line.strip())
+
+    @staticmethod
+    def _load(line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return line.strip()
@@ -0,0 +1,277 @@
+"""
+Opt-in request instrumentation (``REQUEST_PROFILING=true``).
+
+Every request gets its wall time and response size recorded, which costs two
+clock reads. A sampled fraction (``REQUEST_PROFILING_SAMPLE_RATE``) is also
+profiled in depth: each SQL statement is timed by an execute wrapper kept
+on every connection and serializer ``.data``/render time is measured.
+Sampled responses carry a ``Server-Timing`` header; slow requests and
+repeated identical statements (N+1 patterns) are logged as one JSON object
+per line. Per-route histograms are served in the Prometheus text
+format by ``metrics``; they live in process memory, so each worker reports
+its own.
+"""
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+from .cache import get_cache_stats
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class Profile:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+        self.serializing = False
+        self.render_started = None
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def duplicates(self, threshold):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+def time_query(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.execute(execute, sql, params, many, context)
+
+
+def install_query_timer(sender=None, connection=None, **kwargs):
+    """
+    Keep ``time_query`` on ``connection`` for good. Connections are per thread
+    and under ASGI the queries run in ``sync_to_async`` threads, not where the
+    middleware runs, so the wrapper finds the request's profile through the
+    ``current_profile`` ContextVar (which ``sync_to_async`` carries over).
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class Registry:
+    """Histograms keyed by ``(metric, route, method)``."""
+    metrics = {
+        'api_request_duration_seconds': ('Wall time per request.', DURATION_BUCKETS),
+        'api_response_size_bytes': ('Response body size.', SIZE_BUCKETS),
+        'api_request_db_queries': ('SQL statements per sampled request.', QUERY_BUCKETS),
+        'api_request_db_seconds': ('SQL time per sampled request.', DURATION_BUCKETS),
+        'api_request_serialize_seconds': ('Serializer and render time per sampled request.', DURATION_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(dict)
+
+    def observe(self, metric, labels, value):
+        with self._lock:
+            histogram = self._histograms[metric].get(labels)
+            if histogram is None:
+                histogram = self._histograms[metric][labels] = Histogram(self.metrics[metric][1])
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric, (help_text, _) in self.metrics.items():
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+                for (route, method), histogram in sorted(self._histograms[metric].items()):
+                    labels = f'route="{route}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.total}')
+                    lines.append(f'{metric}_count{{{labels}}} {cumulative}')
+        lines += ['# HELP api_response_cache_total Response cache lookups by outcome.',
+                  '# TYPE api_response_cache_total counter']
+        for (namespace, outcome), count in sorted(get_cache_stats().items()):
+            lines.append(f'api_response_cache_total{{namespace="{namespace}",outcome="{outcome}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def instrument_serializers():
+    """
+    Time top-level ``serializer.data`` evaluation for profiled requests.
+    Nested serializers go through ``to_representation``, not ``.data``, so
+    only the outermost call is counted; SQL run lazily inside it is not.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data
+    if getattr(original.fget, 'profiled', False):
+        return
+
+    def data(self):
+        profile = current_profile.get()
+        if profile is None or profile.serializing:
+            return original.fget(self)
+        profile.serializing = True
+        start, sql_before = time.perf_counter(), profile.sql_time
+        try:
+            return original.fget(self)
+        finally:
+            profile.serializing = False
+            profile.serialize_time += time.perf_counter() - start - (profile.sql_time - sql_before)
+
+    data.profiled = True
+    BaseSerializer.data = property(data)
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unresolved'
+
+
+def response_size(response):
+    return 0 if response.streaming else len(response.content)
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0.05)
+        self.slow_seconds = getattr(settings, 'SLOW_REQUEST_MS', 500) / 1000
+        self.duplicate_threshold = getattr(settings, 'DUPLICATE_QUERY_THRESHOLD', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_timer, dispatch_uid='api.profiling.install_query_timer')
+        for alias in connections:
+            # This thread's connections may predate the signal receiver
+            install_query_timer(connection=connections[alias])
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile, token = self.start()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(token)
+        return self.finish(request, response, profile, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        profile, token = self.start()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(token)
+        return self.finish(request, response, profile, time.perf_counter() - start)
+
+    def start(self):
+        if random.random() >= self.sample_rate:
+            return None, None
+        profile = Profile()
+        return profile, current_profile.set(profile)
+
+    def stop(self, token):
+        if token is not None:
+            current_profile.reset(token)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook; time the render itself
+        profile = current_profile.get()
+        if profile is not None:
+            profile.render_started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self.rendered(profile))
+        return response
+
+    def rendered(self, profile):
+        profile.render_time += time.perf_counter() - profile.render_started
+
+    def finish(self, request, response, profile, duration):
+        labels = (route_of(request), request.method)
+        size = response_size(response)
+        registry.observe('api_request_duration_seconds', labels, duration)
+        registry.observe('api_response_size_bytes', labels, size)
+        if profile is not None:
+            serialize = profile.serialize_time + profile.render_time
+            registry.observe('api_request_db_queries', labels, profile.queries)
+            registry.observe('api_request_db_seconds', labels, profile.sql_time)
+            registry.observe('api_request_serialize_seconds', labels, serialize)
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={profile.sql_time * 1000:.1f};desc="{profile.queries} queries"',
+                f'serialize;dur={profile.serialize_time * 1000:.1f}',
+                f'render;dur={profile.render_time * 1000:.1f}',
+                f'total;dur={duration * 1000:.1f}',
+            ])
+            for sql, count in profile.duplicates(self.duplicate_threshold):
+                self.log('duplicate_queries', request, labels, count=count, sql=sql[:500])
+        if duration >= self.slow_seconds:
+            report = {'status': response.status_code, 'duration_ms': round(duration * 1000, 1), 'bytes': size}
+            if profile is not None:
+                report.update(queries=profile.queries, db_ms=round(profile.sql_time * 1000, 1),
+                              serialize_ms=round((profile.serialize_time + profile.render_time) * 1000, 1))
+            self.log('slow_request', request, labels, **report)
+        return response
+
+    def log(self, event, request, labels, **fields):
+        record = {'event': event, 'route': labels[0], 'method': labels[1], 'path': request.path, **fields}
+        logger.warning(json.dumps(record, default=str))
+
+
+def metrics(request):
+    """Prometheus text exposition of this process's histograms."""
+    if not getattr(settings, 'REQUEST_PROFILING', False):
+        raise Http404
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not request.user.is_staff:
+        # No token configured: only a logged-in staff session may scrape
+        return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,51 @@
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf
+
+from .models import Garage, Review
+
+
+def average(rating_sum, rating_count):
+    # Shared by both writers so a rebuild compares equal to incremental updates
+    return Cast(rating_sum, FloatField()) / NullIf(rating_count, 0)
+
+
+def apply_rating_delta(garage_id, count_delta, sum_delta):
+    """
+    Shift a garage's stored rating aggregates by the given deltas in a single
+    UPDATE. The average is derived from the pre-update row values so it stays
+    consistent under concurrent writes.
+    """
+    new_count = F('rating_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    Garage.objects.filter(pk=garage_id).update(
+        rating_count=new_count,
+        rating_sum=new_sum,
+        average_rating=average(new_sum, new_count),
+        # update() skips auto_now; exports pick up rating changes through updated_at
+        updated_at=Now(),
+    )
+
+
+def rebuild_rating_stats(queryset=None):
+    """
+    Recompute rating aggregates from the reviews table for every garage in
+    `queryset` (all garages by default). Only garages whose stored values
+    were wrong are written, and those get a new ``updated_at`` so incremental
+    exports pick the corrections up. Returns the number of rows updated.
+    """
+    if queryset is None:
+        queryset = Garage.objects.all()
+    reviews = Review.objects.filter(garage=OuterRef('pk')).order_by().values('garage')
+    count = Coalesce(Subquery(reviews.annotate(c=Count('pk')).values('c'), output_field=IntegerField()), Value(0))
+    total = Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s'), output_field=IntegerField()), Value(0))
+    stale = queryset.alias(new_count=count, new_sum=total, new_average=average(total, count)).filter(
+        ~Q(rating_count=F('new_count')) | ~Q(rating_sum=F('new_sum'))
+        | Q(new_count=0, average_rating__isnull=False)
+        | (Q(new_count__gt=0) & ~Q(average_rating=F('new_average')))
+    )
+    return Garage.objects.filter(pk__in=stale.values('pk')).update(
+        rating_count=count,
+        rating_sum=total,
+        average_rating=average(total, count),
+        updated_at=Now(),
+    )
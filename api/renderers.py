@@ -0,0 +1,36 @@
+"""
+JSON rendering through orjson, when it is installed (``pip install orjson``).
+
+The bytes match DRF's ``JSONRenderer`` with its default settings: compact,
+UTF-8, with U+2028/U+2029 escaped. Dates and times, ``Decimal``, lazy
+strings and the other types orjson would format differently go through
+DRF's own encoder. Indented or ASCII-only output, numbers orjson cannot
+represent and a missing orjson all fall back to the stdlib encoder. Two
+differences remain: NaN and infinity render as ``null`` instead of raising,
+and floats below 1e-4 or from 1e16 up are written without an exponent or
+with a shorter one (``0.00001``, ``1e16``); they parse to the same value.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped by DRF so the output is also valid JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,90 @@
+"""
+Primary/replica routing. Reads go to the primary unless the current request
+has opted in through ``ReplicaReadMixin``: safe requests to the API views
+that use it are served from one replica (chosen per request), everything
+else, including every write and migration, stays on ``default``.
+
+Read-your-writes: a successful unsafe request pins its user to the primary
+for ``DATABASE_REPLICA_PIN_SECONDS`` so the next poll sees the new row even
+if the replicas are still catching up.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_PREFIX = 'db-pin'
+
+# Alias reads should use for the current request; None means the primary
+read_alias = ContextVar('read_alias', default=None)
+
+
+def pin_key(user_id):
+    return f'{PIN_PREFIX}:{user_id}'
+
+
+def pin_to_primary(user):
+    cache.set(pin_key(user.pk), 1, pin_seconds())
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(pin_key(user.pk)) is not None
+
+
+def pin_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5)
+
+
+@contextmanager
+def primary_reads():
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def choose_replica():
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    return random.choice(replicas) if replicas else None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+    """
+    Serves safe requests from a replica unless the user wrote recently, and
+    pins the user to the primary after a successful write.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Runs after authentication, so the token lookup itself always hits the primary
+        alias = choose_replica()
+        if alias and request.method in SAFE_METHODS and not is_pinned(request.user):
+            self._read_alias_token = read_alias.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_read_alias_token', None)
+        if token is not None:
+            read_alias.reset(token)
+            self._read_alias_token = None
+        if (getattr(settings, 'DATABASE_REPLICAS', None) and request.method not in SAFE_METHODS
+                and response.status_code < 400 and request.user.is_authenticated):
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,9 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .images import rendition_urls
 from .models import (
-    Garage, Part, Review, ForumThread, ForumPost, Service, GarageService
+    Garage, Part, Profile, Review, ForumThread, ForumPost, Service, GarageService, ServiceOffer
 )
-from django.db.models import Avg
 # from django.contrib.gis.geos import Point
 # # Assuming the models are defined in the same app as serializers.py
 # from django.contrib.gis.db import models as gis_models
@@ -11,11 +11,58 @@ from django.db.models import Avg
 # # Serializers for the models in the online garage application
 
 
+def split_param(value):
+    return {part.strip() for part in value.split(',') if part.strip()} if value else set()
+
+class DynamicFieldsMixin:
+    """
+    Lets clients shape the output with ``?fields=a,b`` (keep only these) and
+    ``?expand=x,y`` (add optional nested fields from ``Meta.expandable_fields``).
+    Views use ``resolve_field_names`` to prefetch only what will be rendered.
+    """
+    @classmethod
+    def resolve_field_names(cls, request):
+        names = list(cls.Meta.fields)
+        expandable = [n for n in getattr(cls.Meta, 'expandable_fields', ()) if n not in names]
+        if request is None:
+            return names
+        only = split_param(request.query_params.get('fields'))
+        expand = split_param(request.query_params.get('expand'))
+        names += [n for n in expandable if n in expand or n in only]
+        if only:
+            names = [n for n in names if n in only]
+        return names
+
+    def get_field_names(self, declared_fields, info):
+        return self.resolve_field_names(self.context.get('request'))
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email']
 
+class ProfileSerializer(serializers.ModelSerializer):
+    profile_picture_renditions = serializers.SerializerMethodField()
+    class Meta:
+        model = Profile
+        fields = ['user_type', 'phone_number', 'profile_picture', 'profile_picture_renditions']
+        read_only_fields = fields
+
+    def get_profile_picture_renditions(self, obj):
+        return rendition_urls(obj.profile_picture_renditions, self.context.get('request'))
+
+class UserDetailsSerializer(serializers.ModelSerializer):
+    """``/api/auth/user/`` (dj-rest-auth): the account plus its profile and picture renditions."""
+    profile = ProfileSerializer(read_only=True)
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'profile']
+        read_only_fields = ['email']
+
+class AuthTokenSerializer(serializers.Serializer):
+    """Login/registration response; ``key`` is only known on a freshly issued ``AuthToken``."""
+    key = serializers.CharField(read_only=True)
+
 class ReviewSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     class Meta:
@@ -29,7 +76,7 @@ class GarageServiceSerializer(serializers.ModelSerializer):
         model = GarageService
         fields = ['id', 'service_name', 'price']
 
-class GarageSerializer(serializers.ModelSerializer):
+class GarageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
     reviews = ReviewSerializer(many=True, read_only=True)
     services_offered = GarageServiceSerializer(many=True, read_only=True)
@@ -41,25 +88,52 @@ class GarageSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'description', 'address', 'city', 'phone_number',
             'email', 'website', 'location', 'owner', 'reviews', 'services_offered',
-            'distance_km', 'average_rating'
+            'distance_km', 'average_rating', 'rating_count'
         ]
+        # Columns the method fields read, for the compiled list path (api.fastpath)
+        fast_sources = {'distance_km': ('distance',), 'average_rating': ('average_rating',)}
     
     def get_distance_km(self, obj):
-        if hasattr(obj, 'distance'):
-            return round(obj.distance.m / 1000, 2)
+        if getattr(obj, 'distance', None) is not None:
+            # KNN (<->) annotations are plain metres; Distance() ones are measure objects
+            meters = getattr(obj.distance, 'm', obj.distance)
+            return round(meters / 1000, 2)
         return None
     
     def get_average_rating(self, obj):
-        from django.db.models import Avg
-        avg = obj.reviews.aggregate(Avg('rating')).get('rating__avg')
+        # Read the denormalized aggregate instead of querying reviews per row
+        avg = obj.average_rating
         return round(avg, 1) if avg else None
 
+class GarageListSerializer(GarageSerializer):
+    """Compact list item: summary fields and counts, nested data only on ?expand=."""
+    services_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Garage
+        fields = [
+            'id', 'name', 'address', 'city', 'location', 'distance_km',
+            'average_rating', 'rating_count', 'services_count'
+        ]
+        expandable_fields = ['description', 'phone_number', 'email', 'website', 'owner', 'reviews', 'services_offered']
+        fast_sources = GarageSerializer.Meta.fast_sources
+
 class PartSerializer(serializers.ModelSerializer):
     seller_garage = serializers.StringRelatedField()
     category = serializers.StringRelatedField()
+    image_renditions = serializers.SerializerMethodField()
     class Meta:
         model = Part
-        fields = '__all__'
+        exclude = ['search_vector']
+        # StringRelatedField renders str(obj); Garage and PartCategory __str__ is the name
+        fast_sources = {
+            'seller_garage': ('seller_garage__name',),
+            'category': ('category__name',),
+            'image_renditions': ('image_renditions',),
+        }
+
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj.image_renditions, self.context.get('request'))
 
 class ForumPostSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
@@ -68,8 +142,84 @@ class ForumPostSerializer(serializers.ModelSerializer):
         fields = ['id', 'author', 'content', 'created_at']
 
 class ForumThreadSerializer(serializers.ModelSerializer):
+    """Thread summary; posts are paged separately under /forum/threads/{id}/posts/."""
     author = UserSerializer(read_only=True)
-    posts = ForumPostSerializer(many=True, read_only=True)
+    last_poster = UserSerializer(read_only=True)
     class Meta:
         model = ForumThread
-        fields = ['id', 'title', 'author', 'created_at', 'posts']
\ No newline at end of file
+        fields = [
+            'id', 'title', 'author', 'created_at',
+            'post_count', 'last_post_at', 'last_poster', 'last_post_excerpt'
+        ]
+        read_only_fields = ['post_count', 'last_post_at', 'last_post_excerpt']
+
+class ServiceOfferSerializer(serializers.ModelSerializer):
+    garage_name = serializers.CharField(source='garage.name', read_only=True)
+    city = serializers.CharField(source='garage.city', read_only=True)
+    distance_km = serializers.SerializerMethodField()
+    class Meta:
+        model = ServiceOffer
+        fields = ['id', 'service', 'garage', 'garage_name', 'city', 'price', 'location', 'distance_km']
+
+    def get_distance_km(self, obj):
+        return round(obj.distance / 1000, 2) if getattr(obj, 'distance', None) is not None else None
+
+class PartInventoryRowSerializer(serializers.Serializer):
+    """One row of a bulk part upsert; ``sku`` identifies the part within the garage."""
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=255, required=False)
+    description = serializers.CharField(required=False, allow_blank=True)
+    category = serializers.SlugField(max_length=100, required=False, allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    is_available = serializers.BooleanField(required=False)
+
+class ServicePriceRowSerializer(serializers.Serializer):
+    """One row of a bulk service price upsert, keyed by service name."""
+    service = serializers.CharField(max_length=100)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+class GarageImportRowSerializer(serializers.Serializer):
+    """
+    One garage of a bulk import (api.imports), keyed by ``ref``. Rows without
+    ``lat``/``lon`` are geocoded from their address.
+    """
+    ref = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(allow_blank=True, default='')
+    address = serializers.CharField(max_length=255)
+    city = serializers.CharField(max_length=100)
+    country = serializers.CharField(max_length=100)
+    phone_number = serializers.CharField(max_length=20)
+    email = serializers.EmailField()
+    website = serializers.URLField(allow_null=True, default=None)
+    is_verified = serializers.BooleanField(default=False)
+    lat = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    lon = serializers.FloatField(min_value=-180, max_value=180, required=False)
+    # Set for GeoJSON features, which must be points
+    geometry_type = serializers.ChoiceField(choices=['Point'], required=False, write_only=True)
+
+    def validate(self, attrs):
+        if ('lat' in attrs) != ('lon' in attrs):
+            raise serializers.ValidationError('Give both lat and lon, or neither to geocode the address.')
+        attrs.pop('geometry_type', None)
+        return attrs
+
+class ServiceImportRowSerializer(ServicePriceRowSerializer):
+    garage_ref = serializers.CharField(max_length=64)
+
+class PartImportRowSerializer(PartInventoryRowSerializer):
+    garage_ref = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(allow_blank=True, default='')
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    stock = serializers.IntegerField(min_value=0, default=0)
+    is_available = serializers.BooleanField(default=True)
+
+class ReservationItemSerializer(serializers.Serializer):
+    part = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=1000)
+
+class ReservationSerializer(serializers.Serializer):
+    """A basket to hold; every line is reserved or none is."""
+    items = ReservationItemSerializer(many=True, allow_empty=False, max_length=100)
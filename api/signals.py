@@ -0,0 +1,169 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_tokens_on_commit
+from .cache import bump_namespaces_on_commit
+from .forum import deleting_threads, record_deleted_post, record_edited_post, record_new_post
+from .images import schedule_renditions
+from .models import AuthToken, ForumPost, ForumThread, Garage, GarageService, Part, Profile, Review
+from .offers import sync_garage_offers, sync_offer
+from .ratings import apply_rating_delta
+from .tiles import invalidate_tiles_on_commit
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    # Only updates need the old row; creates are applied as a pure increment.
+    instance._previous_rating = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._previous_rating = (
+        Review.objects.filter(pk=instance.pk).values_list('garage_id', 'rating').first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        apply_rating_delta(instance.garage_id, 1, instance.rating)
+        return
+    old_garage_id, old_rating = previous
+    if old_garage_id != instance.garage_id:
+        apply_rating_delta(old_garage_id, -1, -old_rating)
+        apply_rating_delta(instance.garage_id, 1, instance.rating)
+    elif old_rating != instance.rating:
+        apply_rating_delta(instance.garage_id, 0, instance.rating - old_rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    apply_rating_delta(instance.garage_id, -1, -instance.rating)
+
+
+@receiver(pre_save, sender=Garage)
+def remember_previous_map_state(sender, instance, raw=False, **kwargs):
+    instance._previous_map_state = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._previous_map_state = (
+        Garage.objects.filter(pk=instance.pk).values_list('location', 'is_verified', 'name').first()
+    )
+
+
+@receiver(post_save, sender=Garage)
+def invalidate_tiles_on_save(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_map_state', None)
+    if previous is None:
+        if instance.is_verified:
+            invalidate_tiles_on_commit([instance.location])
+        return
+    old_location, was_verified, old_name = previous
+    if (old_location, was_verified, old_name) == (instance.location, instance.is_verified, instance.name):
+        return
+    points = []
+    if was_verified:
+        points.append(old_location)
+    if instance.is_verified:
+        points.append(instance.location)
+    invalidate_tiles_on_commit(points)
+
+
+@receiver(post_save, sender=Garage)
+def sync_offers_on_garage_save(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_map_state', None)
+    if raw or previous is None:
+        return
+    old_location, was_verified, _ = previous
+    if (old_location, was_verified) != (instance.location, instance.is_verified):
+        sync_garage_offers(instance)
+
+
+@receiver(post_save, sender=GarageService)
+def sync_offer_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_offer(instance)
+
+
+@receiver(post_delete, sender=Garage)
+def invalidate_tiles_on_delete(sender, instance, **kwargs):
+    if instance.is_verified:
+        invalidate_tiles_on_commit([instance.location])
+
+
+@receiver(post_save, sender=ForumPost)
+def update_thread_summary_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        record_new_post(instance)
+    else:
+        record_edited_post(instance)
+
+
+@receiver(post_delete, sender=ForumPost)
+def update_thread_summary_on_delete(sender, instance, **kwargs):
+    record_deleted_post(instance)
+
+
+# Django deletes a thread's posts before the thread itself and signals each
+# post; marking the thread first spares that cascade the summary queries.
+@receiver(pre_delete, sender=ForumThread)
+def mark_thread_deleting(sender, instance, **kwargs):
+    deleting_threads().add(instance.pk)
+
+
+@receiver(post_delete, sender=ForumThread)
+def unmark_thread_deleting(sender, instance, **kwargs):
+    deleting_threads().discard(instance.pk)
+
+
+@receiver(post_save, sender=Part)
+def render_part_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_renditions(instance, 'image')
+
+
+@receiver(post_save, sender=Profile)
+def render_profile_picture(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_renditions(instance, 'profile_picture')
+
+
+@receiver(post_save, sender=AuthToken)
+@receiver(post_delete, sender=AuthToken)
+def invalidate_cached_token(sender, instance, **kwargs):
+    invalidate_tokens_on_commit([instance.digest])
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_tokens(sender, instance, raw=False, **kwargs):
+    # Covers deactivation as well as profile changes of the cached user object
+    if raw:
+        return
+    invalidate_tokens_on_commit(AuthToken.objects.filter(user=instance).values_list('digest', flat=True))
+
+
+# Response-cache namespaces affected by writes to each model (see api.cache)
+CACHE_NAMESPACES = {
+    Garage: ('garages', 'parts'),
+    GarageService: ('garages',),
+    Review: ('garages',),
+    Part: ('parts',),
+    ForumThread: ('forum',),
+    ForumPost: ('forum',),
+}
+
+
+def invalidate_response_cache(sender, **kwargs):
+    if kwargs.get('raw'):
+        return
+    bump_namespaces_on_commit(CACHE_NAMESPACES[sender])
+
+
+for model in CACHE_NAMESPACES:
+    post_save.connect(invalidate_response_cache, sender=model, dispatch_uid=f'response-cache-save-{model.__name__}')
+    post_delete.connect(invalidate_response_cache, sender=model, dispatch_uid=f'response-cache-delete-{model.__name__}')
@@ -0,0 +1,184 @@
+"""
+Stock reservations and checkout.
+
+A reservation takes stock off ``Part.stock`` straight away with a conditional
+``UPDATE ... WHERE stock >= quantity`` and records who holds it until when.
+Checkout makes the hold permanent; releasing it, or letting it expire, hands
+the stock back. Every basket is one SQL statement whatever its size: line
+items travel as two arrays, rows are locked in id order (so overlapping
+baskets queue instead of deadlocking) and locks are held only for that
+statement, never across a request.
+"""
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import bump_namespaces_on_commit
+from .models import Part, StockReservation
+
+RELEASE_BATCH_SIZE = 1000
+
+RESERVE_SQL = """
+WITH items AS (
+    SELECT * FROM unnest(%(part_ids)s::bigint[], %(quantities)s::integer[]) AS t(part_id, quantity)
+), locked AS (
+    SELECT p.id FROM {part} p JOIN items i ON i.part_id = p.id ORDER BY p.id FOR UPDATE OF p
+), taken AS (
+    UPDATE {part} p
+    SET stock = p.stock - i.quantity, is_available = p.stock > i.quantity, updated_at = now()
+    FROM items i JOIN locked l ON l.id = i.part_id
+    WHERE p.id = i.part_id AND p.is_available AND p.stock >= i.quantity
+    RETURNING p.id, i.quantity, NOT p.is_available AS sold_out
+)
+INSERT INTO {reservation} (hold, user_id, part_id, quantity, expires_at, sold_out)
+SELECT %(hold)s, %(user_id)s, id, quantity, %(expires_at)s, sold_out FROM taken
+RETURNING part_id
+"""
+
+# is_available comes back on only for parts at 0 that a hold switched off:
+# the reserve that took the last units marks its row ``sold_out``, and
+# checkout hands that mark on to the part's remaining holds. (The subquery
+# sees the rows being released too.) Parts a seller switched off themselves,
+# or restocked and left off, stay off.
+RELEASE_SQL = """
+WITH released AS (
+    DELETE FROM {reservation} WHERE {condition} RETURNING part_id, quantity
+), items AS (
+    SELECT part_id, SUM(quantity) AS quantity FROM released GROUP BY part_id
+), locked AS (
+    SELECT p.id FROM {part} p JOIN items i ON i.part_id = p.id ORDER BY p.id FOR UPDATE OF p
+)
+UPDATE {part} p
+SET stock = p.stock + i.quantity, updated_at = now(),
+    is_available = p.is_available OR (p.stock = 0 AND EXISTS (
+        SELECT 1 FROM {reservation} r WHERE r.part_id = p.id AND r.sold_out
+    ))
+FROM items i JOIN locked l ON l.id = i.part_id
+WHERE p.id = i.part_id
+RETURNING i.quantity
+"""
+
+CHECKOUT_SQL = """
+WITH done AS (
+    DELETE FROM {reservation}
+    WHERE hold = %(hold)s AND user_id = %(user_id)s AND expires_at > now()
+    RETURNING part_id, quantity, sold_out
+), handed_on AS (
+    UPDATE {reservation} r SET sold_out = true
+    FROM done d
+    WHERE d.sold_out AND r.part_id = d.part_id AND r.hold <> %(hold)s
+)
+SELECT part_id, quantity FROM done
+"""
+
+
+class OutOfStock(Exception):
+    def __init__(self, part_ids):
+        super().__init__(f'Not enough stock for parts {part_ids}.')
+        self.part_ids = part_ids
+
+
+@dataclass
+class Hold:
+    hold: uuid.UUID
+    expires_at: datetime
+    # part id -> quantity
+    items: dict
+
+    def as_dict(self):
+        return {
+            'hold': str(self.hold),
+            'expires_at': self.expires_at,
+            'items': [{'part': part_id, 'quantity': quantity} for part_id, quantity in sorted(self.items.items())],
+        }
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return {'part': quote(Part._meta.db_table), 'reservation': quote(StockReservation._meta.db_table)}
+
+
+def reserve(user, items, ttl=None):
+    """
+    Hold ``items`` (``(part_id, quantity)`` pairs) for ``user``. All or
+    nothing: raises ``OutOfStock`` naming every part that could not be covered.
+    """
+    quantities = Counter()
+    for part_id, quantity in items:
+        quantities[part_id] += quantity
+    ttl = ttl if ttl is not None else getattr(settings, 'STOCK_RESERVATION_TTL', 900)
+    hold = Hold(uuid.uuid4(), timezone.now() + timedelta(seconds=ttl), dict(quantities))
+    try:
+        _take(user, hold)
+    except OutOfStock as exc:
+        # Lapsed holds may still be sitting on the stock; hand it back and retry once
+        if not release_expired(part_ids=exc.part_ids):
+            raise
+        _take(user, hold)
+    return hold
+
+
+def _take(user, hold):
+    part_ids = sorted(hold.items)
+    params = {
+        'part_ids': part_ids, 'quantities': [hold.items[part_id] for part_id in part_ids],
+        'hold': hold.hold, 'user_id': user.pk, 'expires_at': hold.expires_at,
+    }
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(RESERVE_SQL.format(**_tables()), params)
+            taken = {row[0] for row in cursor.fetchall()}
+        missing = [part_id for part_id in part_ids if part_id not in taken]
+        if missing:
+            # Rolls back the lines that did fit
+            raise OutOfStock(missing)
+        bump_namespaces_on_commit(('parts',))
+
+
+def _release(condition, params):
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(RELEASE_SQL.format(condition=condition, **_tables()), params)
+            released = sum(row[0] for row in cursor.fetchall())
+        if released:
+            bump_namespaces_on_commit(('parts',))
+    return released
+
+
+def release(user, hold):
+    """Give back the stock of one of ``user``'s holds; returns the units released."""
+    return _release('hold = %(hold)s AND user_id = %(user_id)s', {'hold': hold, 'user_id': user.pk})
+
+
+def release_expired(part_ids=None, batch_size=RELEASE_BATCH_SIZE):
+    """
+    Give back stock from up to ``batch_size`` lapsed reservations, optionally
+    only for ``part_ids``. Rows another sweeper is already releasing are
+    skipped rather than waited on. Returns the units released.
+    """
+    condition = 'expires_at <= now()'
+    params = {'limit': batch_size}
+    if part_ids is not None:
+        condition += ' AND part_id = ANY(%(part_ids)s)'
+        params['part_ids'] = list(part_ids)
+    table = _tables()['reservation']
+    return _release(
+        f'id IN (SELECT id FROM {table} WHERE {condition} ORDER BY id LIMIT %(limit)s FOR UPDATE SKIP LOCKED)',
+        params,
+    )
+
+
+def checkout(user, hold):
+    """
+    Complete a hold. The stock already left ``Part.stock`` when it was
+    reserved, so this only makes that permanent. Returns the purchased
+    ``{part_id: quantity}``, empty if the hold is unknown or has expired.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(CHECKOUT_SQL.format(**_tables()), {'hold': hold, 'user_id': user.pk})
+        return dict(cursor.fetchall())
@@ -1,3 +1,857 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+
+from . import benchmark
+from .authentication import CachedTokenAuthentication, issue_token, local_tokens, token_digest
+from .models import (
+    AuthToken, ForumPost, ForumThread, GeocodedPlace, Garage, GarageService, ImportRun, Part, PartCategory,
+    Profile, Review, Service, ServiceOffer, StockReservation
+)
+from .cache import get_or_set_locked, get_versions
+from .geocoding import geocode_many, local_places
+from .images import store_renditions
+from .ratings import rebuild_rating_stats
+from .imports import run_import
+from .renderers import FastJSONRenderer
+from .serializers import UserDetailsSerializer
+from .stock import OutOfStock, checkout, release, reserve
+from .tiles import get_tile, tile_cache_key, tile_for_point
+
+
+def seed_catalogue():
+    """A small but complete object graph touching every model the API reads."""
+    owner = User.objects.create_user('owner', 'owner@example.com', 'pw')
+    reviewer = User.objects.create_user('reviewer', 'reviewer@example.com', 'pw')
+    garage = Garage.objects.create(
+        owner=owner, name='Westlands Auto', description='Full service garage',
+        address='1 Ring Rd', city='Nairobi', country='Kenya', location=Point(36.80, -1.26, srid=4326),
+        phone_number='0700000000', email='garage@example.com', is_verified=True,
+    )
+    service = Service.objects.create(name='Oil change')
+    GarageService.objects.create(garage=garage, service=service, price='25.00')
+    Review.objects.create(garage=garage, user=reviewer, rating=4, comment='Quick and tidy')
+    category = PartCategory.objects.create(name='Brakes', slug='brakes')
+    part = Part.objects.create(
+        seller_garage=garage, category=category, name='Brake pads',
+        description='Ceramic front brake pads', price='40.00', stock=5,
+    )
+    thread = ForumThread.objects.create(title='Squeaky brakes', author=reviewer)
+    ForumPost.objects.create(thread=thread, author=owner, content='Check the pads first.')
+    return {'owner': owner, 'reviewer': reviewer, 'garage': garage, 'service': service, 'part': part, 'thread': thread}
+
+
+class RatingStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def stats(self, garage):
+        garage.refresh_from_db()
+        return garage.rating_count, garage.rating_sum, garage.average_rating
+
+    def test_review_signals_maintain_aggregates(self):
+        garage, owner = self.objects['garage'], self.objects['owner']
+        self.assertEqual(self.stats(garage), (1, 4, 4.0))
+        review = Review.objects.create(garage=garage, user=owner, rating=1, comment='Slow')
+        self.assertEqual(self.stats(garage), (2, 5, 2.5))
+        review.rating = 5
+        review.save()
+        self.assertEqual(self.stats(garage), (2, 9, 4.5))
+        review.delete()
+        self.assertEqual(self.stats(garage), (1, 4, 4.0))
+        Review.objects.all().delete()
+        self.assertEqual(self.stats(garage), (0, 0, None))
+
+    def test_rebuild_fixes_drifted_garages_only(self):
+        garage = self.objects['garage']
+        other = Garage.objects.create(
+            owner=self.objects['owner'], name='Empty Bay', address='2 Ring Rd', city='Nairobi', country='Kenya',
+            location=Point(36.81, -1.27, srid=4326), phone_number='0700000001', email='bay@example.com',
+        )
+        long_ago = timezone.now() - timedelta(days=30)
+        Garage.objects.filter(pk=garage.pk).update(rating_count=7, rating_sum=9, average_rating=1.3, updated_at=long_ago)
+        Garage.objects.filter(pk=other.pk).update(updated_at=long_ago)
+
+        call_command('rebuild_rating_stats', stdout=io.StringIO())
+        self.assertEqual(self.stats(garage), (1, 4, 4.0))
+        self.assertGreater(garage.updated_at, long_ago)
+        other.refresh_from_db()
+        self.assertEqual(other.updated_at, long_ago)
+        # Nothing left to correct
+        self.assertEqual(rebuild_rating_stats(), 0)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Every SELECT an endpoint issues must be answerable from an index. Sequential
+    scans are disabled while explaining, so a plan that still contains one
+    means no usable index exists for that query shape.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def endpoint_urls(self):
+        garage, part, thread = self.objects['garage'], self.objects['part'], self.objects['thread']
+        return [
+            reverse('garage-list'),
+            reverse('garage-list') + '?city=nairobi',
+            reverse('garage-list') + '?lat=-1.28&lon=36.82&radius_km=10',
+            reverse('garage-list') + '?bbox=36.7,-1.4,36.9,-1.2&expand=reviews,services_offered',
+            reverse('garage-detail', args=[garage.pk]),
+            reverse('garage-reviews', args=[garage.pk]),
+            reverse('garage-tiles', args=[12, *tile_for_point(12, garage.location.x, garage.location.y)]),
+            reverse('service-offers', args=[self.objects['service'].pk]) + '?lat=-1.28&lon=36.82',
+            reverse('part-list'),
+            reverse('part-list') + '?q=brake&category=brakes',
+            reverse('part-detail', args=[part.pk]),
+            reverse('forumthread-list'),
+            reverse('forumthread-detail', args=[thread.pk]),
+            reverse('forumthread-posts', args=[thread.pk]),
+        ]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute('EXPLAIN ' + sql)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute('RESET enable_seqscan')
+
+    def test_endpoint_queries_use_indexes(self):
+        for url in self.endpoint_urls():
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                for query in ctx.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    plan = self.explain(sql)
+                    self.assertNotIn('Seq Scan on api_', plan, f'{url}\n{sql}\n{plan}')
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Guards against N+1 regressions: every route must stay within its fixed
+    query budget however many related rows exist. ``manage.py benchmark_api``
+    runs the same routes at production-like volumes and reports latency.
+    """
+    volume = benchmark.Volume(
+        garages=30, reviews_per_garage=5, services_per_garage=3,
+        parts_per_garage=5, threads=5, posts_per_thread=5,
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(cls.volume)
+
+    def test_routes_stay_within_query_budget(self):
+        client = APIClient()
+        for measurement in benchmark.run(client, repeats=1):
+            with self.subTest(endpoint=measurement.endpoint.name):
+                self.assertLessEqual(measurement.queries, measurement.endpoint.query_budget)
+
+    def test_thread_delete_skips_per_post_summary_updates(self):
+        thread = ForumThread.objects.filter(post_count__gt=1).first()
+        with CaptureQueriesContext(connection) as ctx:
+            thread.delete()
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "api_forumthread"')]
+        self.assertEqual(updates, [])
+
+
+class PartSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+        part = cls.objects['part']
+        # Identical text gives identical ranks, so only the id breaks the ties
+        Part.objects.bulk_create(
+            Part(seller_garage=part.seller_garage, category=part.category, name=part.name,
+                 description=part.description, price=part.price, stock=1)
+            for _ in range(7)
+        )
+
+    def collect_pages(self, url):
+        client, ids = APIClient(), []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_paging_through_tied_ranks(self):
+        expected = sorted(Part.objects.values_list('pk', flat=True))
+        for q in ('ceramic+brake+pads', 'brak+pads'):  # full-text hit, then a typo for the trigram fallback
+            with self.subTest(q=q):
+                cache.clear()
+                ids = self.collect_pages(reverse('part-list') + f'?q={q}&page_size=3')
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(sorted(ids), expected)
+
+
+class CompiledSerializerTests(TestCase):
+    """The compiled list path (api.fastpath) must answer byte for byte like the serializers."""
+    volume = benchmark.Volume(
+        garages=12, reviews_per_garage=4, services_per_garage=3,
+        parts_per_garage=4, threads=1, posts_per_thread=1,
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(cls.volume)
+        Part.objects.filter(pk=Part.objects.order_by('pk').values('pk')[:1]).update(category=None, image='parts/pad.jpg')
+
+    def get_both_ways(self, url):
+        client = APIClient()
+        cache.clear()
+        compiled = client.get(url)
+        cache.clear()
+        with mock.patch('api.fastpath.compile_serializer', return_value=None):
+            regular = client.get(url)
+        self.assertEqual(compiled.status_code, 200)
+        return compiled, regular
+
+    def test_list_responses_match_the_serializers(self):
+        garage = Garage.objects.order_by('pk').first()
+        lon, lat = benchmark.CENTER
+        garages = reverse('garage-list')
+        urls = [
+            garages,
+            f'{garages}?expand=owner,reviews,services_offered&page_size=5',
+            f'{garages}?lat={lat}&lon={lon}&radius_km=50&fields=id,name,distance_km,owner',
+            f'{garages}?ordering=-rating&page_size=3',
+            reverse('part-list') + '?page_size=50',
+            reverse('garage-reviews', args=[garage.pk]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                compiled, regular = self.get_both_ways(url)
+                self.assertEqual(compiled.content, regular.content)
+                if compiled.data['next']:
+                    # Cursors built from value rows lead to the same next page
+                    compiled, regular = self.get_both_ways(compiled.data['next'])
+                    self.assertEqual(compiled.content, regular.content)
+
+    def test_benchmark_serializations_match(self):
+        timings = benchmark.time_serializers(rows=20, repeats=1)
+        self.assertTrue(all(timing.rows for timing in timings))
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {
+            'text': 'line\u2028separator caf\u00e9', 'price': Decimal('12.50'), 'when': timezone.now(),
+            'nested': [{1: None, 'ok': True, 'ratio': 0.25}], 'big': 2 ** 70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class AsyncViewTests(TestCase):
+    """The async read routes answer like the sync ones and sit behind the same throttles and cache."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_async_routes_match_sync_routes(self):
+        garage, part = self.objects['garage'], self.objects['part']
+        pairs = [
+            (reverse('garage-list') + '?lat=-1.28&lon=36.82', reverse('async-garage-list') + '?lat=-1.28&lon=36.82'),
+            (reverse('garage-detail', args=[garage.pk]), reverse('async-garage-detail', args=[garage.pk])),
+            (reverse('part-list') + '?q=brake', reverse('async-part-list') + '?q=brake'),
+            (reverse('part-detail', args=[part.pk]), reverse('async-part-detail', args=[part.pk])),
+            (reverse('garage-reviews', args=[garage.pk]), reverse('async-garage-reviews', args=[garage.pk])),
+        ]
+        for sync_url, async_url in pairs:
+            with self.subTest(url=async_url):
+                expected, response = self.client.get(sync_url), self.client.get(async_url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+    def test_async_responses_are_cached_and_validated(self):
+        url = reverse('async-part-list')
+        first = self.client.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('async-part-detail', args=[0])).status_code, 404)
+
+    def test_async_geo_searches_are_throttled(self):
+        url = reverse('async-garage-list') + '?lat=-1.28&lon=36.82'
+        with mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'geo_search': '3/min'}):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            response = self.client.get(url + '&radius_km=5')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_rejected_requests_are_not_charged(self):
+        garages = reverse('garage-list')
+        with mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'geo_search': '3/min'}):
+            self.assertEqual(self.client.get(garages + '?lat=-1.28&lon=36.82').status_code, 200)
+            self.assertEqual(self.client.get(garages + '?lat=-1.27&lon=36.82').status_code, 429)
+            self.assertEqual(self.client.get(garages + '?lat=-1.26&lon=36.82').status_code, 429)
+            # 2 of 3 tokens spent; the rejected searches must not have added theirs
+            self.assertEqual(self.client.get(garages + '?bbox=36.7,-1.4,36.9,-1.2').status_code, 200)
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.get(reverse('async-garage-list'), HTTP_AUTHORIZATION='Token nope')
+        self.assertEqual(response.status_code, 401)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+        cls.auth = {'Authorization': f'Token {issue_token(cls.objects["owner"]).key}'}
+
+    def sync_body(self, url):
+        response = self.client.get(url, headers=self.auth)
+        self.assertFalse(response.is_async)
+        return b''.join(response.streaming_content)
+
+    async def test_asgi_exports_stream_asynchronously(self):
+        for fmt in ('ndjson', 'csv'):
+            with self.subTest(fmt=fmt):
+                url = reverse('export', args=['parts', fmt])
+                response = await self.async_client.get(url, headers=self.auth)
+                self.assertEqual(response.status_code, 200)
+                # An async iterator is sent as it is read; a sync one would be buffered by Django
+                self.assertTrue(response.is_async)
+                body = b''.join([chunk async for chunk in response.streaming_content])
+                self.assertEqual(body, await sync_to_async(self.sync_body)(url))
+                self.assertIn(b'Brake pads', body)
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_writes_bump_the_namespace_on_commit_only(self):
+        part = self.objects['part']
+        before = get_versions(('parts',))
+        with self.captureOnCommitCallbacks(execute=True):
+            part.price = Decimal('41.00')
+            part.save()
+            self.assertEqual(get_versions(('parts',)), before)
+        after = get_versions(('parts',))
+        self.assertNotEqual(after, before)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                part.price = Decimal('42.00')
+                part.save()
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(get_versions(('parts',)), after)
+
+    def test_cached_reads_stop_at_the_new_version(self):
+        url = reverse('part-detail', args=[self.objects['part'].pk])
+        client = APIClient()
+        self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(client.get(url)['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            Part.objects.get(pk=self.objects['part'].pk).save()
+        self.assertEqual(client.get(url)['X-Cache'], 'MISS')
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        start = threading.Barrier(8)
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value', True
+
+        def read():
+            start.wait()
+            results.append(get_or_set_locked('stampede-test', compute, 60))
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('value', False)] + [('value', True)] * 7)
+
+
+@override_settings(REQUEST_PROFILING=True, METRICS_TOKEN='')
+class MetricsEndpointTests(TestCase):
+    def test_without_a_token_only_staff_may_scrape(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('ops', 'ops@example.com', 'pw', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_is_required_when_set(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer s3cret'}).status_code, 200)
+
+
+class TileInvalidationTests(TestCase):
+    zoom = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def setUp(self):
+        cache.clear()
+
+    def warm(self, point):
+        tile = tile_for_point(self.zoom, point.x, point.y)
+        get_tile(self.zoom, *tile)
+        return tile_cache_key(self.zoom, *tile)
+
+    def test_verified_garage_writes_drop_tiles_after_commit(self):
+        garage = self.objects['garage']
+        old_key = self.warm(garage.location)
+        new_location = Point(37.5, -0.5, srid=4326)
+        new_key = self.warm(new_location)
+        with self.captureOnCommitCallbacks(execute=True):
+            garage.location = new_location
+            garage.save()
+            # A read before the commit must not be able to re-cache a tile we already dropped
+            self.assertIsNotNone(cache.get(old_key))
+        self.assertIsNone(cache.get(old_key))
+        self.assertIsNone(cache.get(new_key))
+
+        new_key = self.warm(new_location)
+        with self.captureOnCommitCallbacks(execute=True):
+            garage.delete()
+        self.assertIsNone(cache.get(new_key))
+
+        site = Point(36.70, -1.35, srid=4326)
+        key = self.warm(site)
+        with self.captureOnCommitCallbacks(execute=True):
+            Garage.objects.create(
+                owner=self.objects['owner'], name='Karen Motors', address='3 Karen Rd', city='Nairobi',
+                country='Kenya', location=site, phone_number='0700000002', email='karen@example.com', is_verified=True,
+            )
+        self.assertIsNone(cache.get(key))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class TileRoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        garage = self.objects['garage']
+        self.tile = (12, *tile_for_point(12, garage.location.x, garage.location.y))
+        self.url = reverse('garage-tiles', args=self.tile)
+
+    def tile_aliases(self):
+        """Aliases the clustering query asked for; every one is answered by the test database."""
+        aliases = []
+
+        def lookup(alias):
+            aliases.append(alias)
+            return connections['default']
+
+        # Only the tile: the cache also holds the user's primary pin
+        cache.delete(tile_cache_key(*self.tile))
+        with mock.patch('api.tiles.connections') as fake:
+            fake.__getitem__.side_effect = lookup
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        return aliases
+
+    def test_tiles_are_read_from_the_replica(self):
+        self.assertEqual(self.tile_aliases(), ['replica1'])
+
+    def test_tiles_fall_back_to_the_primary_after_a_write(self):
+        self.client.force_authenticate(self.objects['reviewer'])
+        response = self.client.post(reverse('forumthread-list'), {'title': 'Noisy clutch'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.tile_aliases(), ['default'])
+
+
+class RenditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def test_stored_renditions_invalidate_cached_parts(self):
+        part = self.objects['part']
+        Part.objects.filter(pk=part.pk).update(image='parts/pad.jpg')
+        before = get_versions(('parts',))
+        # close_old_connections() would drop the test transaction's connection
+        with self.captureOnCommitCallbacks(execute=True), mock.patch('api.images.close_old_connections'):
+            store_renditions(Part, part.pk, 'image', 'parts/pad.jpg', [{'file': '160w.webp', 'width': 160, 'height': 90, 'format': 'webp'}])
+        self.assertNotEqual(get_versions(('parts',)), before)
+        self.assertEqual(Part.objects.get(pk=part.pk).image_renditions['items'][0]['path'], 'renditions/parts/pad/160w.webp')
+
+
+    def test_profile_renditions_are_served(self):
+        owner = self.objects['owner']
+        Profile.objects.create(user=owner, profile_picture='profiles/me.jpg')
+        with self.captureOnCommitCallbacks(execute=True), mock.patch('api.images.close_old_connections'):
+            store_renditions(Profile, owner.profile.pk, 'profile_picture', 'profiles/me.jpg',
+                             [{'file': '96w.webp', 'width': 96, 'height': 96, 'format': 'webp'}])
+        owner.profile.refresh_from_db()
+        renditions = UserDetailsSerializer(owner).data['profile']['profile_picture_renditions']
+        self.assertEqual([(item['width'], item['format']) for item in renditions], [(96, 'webp')])
+        self.assertTrue(renditions[0]['url'].endswith('renditions/profiles/me/96w.webp'))
+
+
+class TokenAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.auth = CachedTokenAuthentication()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token = issue_token(self.objects['owner'])
+
+    def test_only_the_digest_is_stored(self):
+        stored = AuthToken.objects.get(user=self.objects['owner'])
+        self.assertEqual(stored.digest, token_digest(self.token.key))
+        self.assertNotIn(self.token.key, str(list(AuthToken.objects.values_list())))
+
+    def test_cache_hits_skip_the_database(self):
+        with self.assertNumQueries(1):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.objects['owner'])
+        with self.assertNumQueries(0):
+            self.auth.authenticate_credentials(self.token.key)
+        local_tokens.clear()
+        # The shared entry carries the user fields too, so it needs no query either
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual((user.pk, user.username, user.is_active), (self.objects['owner'].pk, 'owner', True))
+        self.assertEqual(token.key, self.token.key)
+
+    def test_deleted_tokens_are_evicted(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            AuthToken.objects.get(user=self.objects['owner']).delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivated_users_are_evicted(self):
+        self.auth.authenticate_credentials(self.token.key)
+        owner = self.objects['owner']
+        owner.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            owner.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_reissuing_revokes_the_previous_key(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            fresh = issue_token(self.objects['owner'])
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(self.auth.authenticate_credentials(fresh.key)[0], self.objects['owner'])
+
+
+class InventoryBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def test_bodies_that_are_not_lists_are_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.objects['owner'])
+        url = reverse('garage-inventory-parts', args=[self.objects['garage'].pk])
+        for body in ('5', '"x"', '{"sku": "BP-1"}', 'null'):
+            with self.subTest(body=body):
+                response = client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_csv_and_ndjson_bodies_are_applied(self):
+        client = APIClient()
+        client.force_authenticate(self.objects['owner'])
+        url = reverse('garage-inventory-parts', args=[self.objects['garage'].pk])
+        bodies = {
+            'text/csv': 'sku,name,price,stock,category\nBP-1,Brake pads,40.00,5,brakes\nBD-2,Brake discs,90.00,2,\n',
+            'application/x-ndjson': '{"sku": "BP-1", "name": "Brake pads", "price": "42.00", "stock": 4}\n\n'
+                                    '{"sku": "OF-3", "name": "Oil filter", "price": "8.00", "stock": 12}\n',
+        }
+        for content_type, body in bodies.items():
+            with self.subTest(content_type=content_type):
+                response = client.post(url, body, content_type=content_type)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['errors'], [])
+                self.assertEqual(response.data['created'] + response.data['updated'], 2)
+        self.assertEqual(
+            dict(Part.objects.filter(sku__in=['BP-1', 'BD-2', 'OF-3']).values_list('sku', 'stock')),
+            {'BP-1': 4, 'BD-2': 2, 'OF-3': 12},
+        )
+
+
+@override_settings(GEOCODER_PROVIDER='api.geocoding.OfflineProvider', GEOCODER_OPTIONS={})
+class GeocodingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def setUp(self):
+        cache.clear()
+        local_places.clear()
+
+    def test_near_search_orders_by_distance_from_place(self):
+        response = APIClient().get(reverse('garage-list') + '?near=near Westlands&radius_km=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([g['id'] for g in response.data['results']], [self.objects['garage'].pk])
+        self.assertLess(response.data['results'][0]['distance_km'], 2)
+
+    def test_unknown_place_is_rejected(self):
+        response = APIClient().get(reverse('garage-list') + '?near=Atlantis')
+        self.assertEqual(response.status_code, 400)
+
+    def test_async_near_search(self):
+        client = APIClient()
+        response = client.get(reverse('async-garage-list') + '?near=near Westlands&radius_km=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([g['id'] for g in json.loads(response.content)['results']], [self.objects['garage'].pk])
+        self.assertEqual(client.get(reverse('async-garage-list') + '?near=Atlantis').status_code, 400)
+
+    def test_results_and_misses_are_persisted(self):
+        result = geocode_many(['1 Ring Rd, Thika, Kenya', 'Atlantis'])
+        self.assertAlmostEqual(result['1 Ring Rd, Thika, Kenya'].y, -1.0333)
+        self.assertIsNone(result['Atlantis'])
+        self.assertEqual(GeocodedPlace.objects.count(), 2)
+
+        local_places.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(geocode_many(['1 ring rd thika kenya'])['1 ring rd thika kenya'], result['1 Ring Rd, Thika, Kenya'])
+
+
+@override_settings(GEOCODER_PROVIDER='api.geocoding.OfflineProvider', GEOCODER_OPTIONS={})
+class GarageImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.objects = seed_catalogue()
+
+    def setUp(self):
+        local_places.clear()
+
+    def write(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def run_file(self, kind, suffix, content, **kwargs):
+        run = ImportRun.objects.create(kind=kind, source=self.write(suffix, content), owner=self.objects['owner'])
+        return run_import(run, chunk_size=2, **kwargs)
+
+    def test_csv_garages_are_upserted_and_geocoded(self):
+        header = 'ref,name,address,city,country,phone_number,email,is_verified,lat,lon\n'
+        run = self.run_file(ImportRun.Kind.GARAGES, '.csv', header + (
+            'g1,Thika Motors,Main St,Thika,Kenya,0711,a@example.com,true,,\n'
+            'g2,Coast Auto,Moi Ave,Mombasa,Kenya,0722,b@example.com,false,-4.05,39.67\n'
+            'g3,Nowhere,1 Road,Atlantis,Sea,0733,c@example.com,true,,\n'
+            'g4,Bad Email,2 Road,Nakuru,Kenya,0744,not-an-email,true,,\n'
+        ))
+        self.assertEqual((run.status, run.rows_done, run.rows_failed), (ImportRun.Status.DONE, 4, 2))
+        self.assertEqual([error['row'] for error in run.errors], [3, 4])
+        thika = Garage.objects.get(external_ref='g1')
+        self.assertEqual(thika.owner, self.objects['owner'])
+        self.assertAlmostEqual(thika.location.y, -1.0333)
+        self.assertEqual(thika.description, '')
+
+        self.run_file(ImportRun.Kind.GARAGES, '.csv', header + 'g1,Thika Motors Ltd,Main St,Thika,Kenya,0711,a@example.com,true,-1.03,37.07\n')
+        thika.refresh_from_db()
+        self.assertEqual((thika.name, thika.location.x), ('Thika Motors Ltd', 37.07))
+        self.assertEqual(Garage.objects.filter(external_ref__isnull=False).count(), 2)
+
+    def test_geocoding_runs_outside_the_chunk_transaction(self):
+        depth, seen = len(connection.savepoint_ids), []
+
+        def record_depth(queries):
+            seen.append(len(connection.savepoint_ids))
+            return geocode_many(queries)
+
+        header = 'ref,name,address,city,country,phone_number,email,is_verified\n'
+        with mock.patch('api.imports.geocode_many', side_effect=record_depth):
+            run = self.run_file(ImportRun.Kind.GARAGES, '.csv', header + 'g1,Thika Motors,Main St,Thika,Kenya,0711,a@example.com,true\n')
+        self.assertEqual(run.rows_failed, 0)
+        # No savepoint beyond the test's own, so no locks were held while geocoding
+        self.assertEqual(seen, [depth])
+
+    def test_geojson_garages_services_and_parts(self):
+        features = [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [36.8 + i / 100, -1.3]},
+             'properties': {'ref': f'k{i}', 'name': f'Garage {i}', 'address': 'Road', 'city': 'Nairobi',
+                            'country': 'Kenya', 'phone_number': '0700', 'email': 'k@example.com', 'is_verified': True}}
+            for i in range(5)
+        ]
+        features.append({'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [[0, 0], [1, 1]]},
+                         'properties': features[0]['properties']})
+        run = self.run_file(ImportRun.Kind.GARAGES, '.geojson',
+                            json.dumps({'type': 'FeatureCollection', 'features': features}))
+        self.assertEqual((run.rows_done, run.rows_failed), (6, 1))
+        self.assertEqual(Garage.objects.filter(external_ref__startswith='k').count(), 5)
+
+        run = self.run_file(ImportRun.Kind.SERVICES, '.csv',
+                            'garage_ref,service,price\nk0,Oil change,30.00\nk1,Oil change,31.00\nzz,Oil change,1\n')
+        self.assertEqual(run.rows_failed, 1)
+        self.assertEqual(ServiceOffer.objects.filter(garage__external_ref__in=['k0', 'k1']).count(), 2)
+
+        lines = [
+            {'garage_ref': 'k0', 'sku': 'BP-1', 'name': 'Brake pads', 'price': '12.50', 'category': 'brakes'},
+            {'garage_ref': 'k0', 'sku': 'BP-1', 'name': 'Brake pads', 'price': '11.00', 'stock': 3},
+            {'garage_ref': 'k1', 'sku': 'X', 'name': 'Wiper', 'price': '2', 'category': 'nope'},
+        ]
+        run = self.run_file(ImportRun.Kind.PARTS, '.ndjson', '\n'.join(map(json.dumps, lines)))
+        self.assertEqual(run.rows_failed, 1)
+        part = Part.objects.get(seller_garage__external_ref='k0', sku='BP-1')
+        self.assertEqual((str(part.price), part.stock, part.category), ('11.00', 3, None))
+
+    def test_resume_skips_committed_rows(self):
+        header = 'ref,name,address,city,country,phone_number,email,lat,lon\n'
+        rows = ''.join(f'r{i},Garage {i},Road,Nairobi,Kenya,0700,r@example.com,-1.3,36.8\n' for i in range(5))
+        run = ImportRun.objects.create(kind=ImportRun.Kind.GARAGES, source=self.write('.csv', header + rows),
+                                       owner=self.objects['owner'], status=ImportRun.Status.FAILED, rows_done=2)
+        progress = []
+        run_import(run, chunk_size=2, progress=lambda run, rate: progress.append(run.rows_done))
+        self.assertEqual(progress, [4, 5])
+        self.assertEqual(sorted(Garage.objects.filter(external_ref__startswith='r').values_list('external_ref', flat=True)),
+                         ['r2', 'r3', 'r4'])
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    """
+    Buyers racing for the same parts, from real concurrent connections: stock
+    must never be oversold and baskets that overlap in opposite order must
+    not deadlock.
+    """
+    buyers = 24
+    stock = 5
+
+    def setUp(self):
+        objects = seed_catalogue()
+        self.pads = objects['part']
+        self.discs = Part.objects.create(
+            seller_garage=objects['garage'], category=self.pads.category, name='Brake discs',
+            description='Vented front discs', price='90.00', stock=self.stock,
+        )
+        self.users = User.objects.bulk_create([User(username=f'buyer{i}') for i in range(self.buyers)])
+
+    def race(self, baskets):
+        """Run ``reserve(user, basket)`` for every pair at once; returns the holds (None when refused)."""
+        start = threading.Barrier(len(baskets))
+        results = [None] * len(baskets)
+
+        def buy(index, user, basket):
+            start.wait()
+            try:
+                results[index] = reserve(user, basket)
+            except OutOfStock:
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(i, user, basket)) for i, (user, basket) in enumerate(baskets)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_baskets_never_oversell(self):
+        pads, discs = self.pads.pk, self.discs.pk
+        baskets = [
+            (user, [(pads, 1), (discs, 1)] if i % 2 else [(discs, 1), (pads, 1)])
+            for i, user in enumerate(self.users)
+        ]
+        holds = [hold for hold in self.race(baskets) if hold is not None]
+
+        self.assertEqual(len(holds), self.stock)
+        for part in Part.objects.filter(pk__in=[pads, discs]):
+            self.assertEqual(part.stock, 0)
+            self.assertFalse(part.is_available)
+        self.assertEqual(StockReservation.objects.count(), 2 * self.stock)
+
+    def test_basket_is_all_or_nothing(self):
+        with self.assertRaises(OutOfStock) as ctx:
+            reserve(self.users[0], [(self.pads.pk, 1), (self.discs.pk, self.stock + 1)])
+        self.assertEqual(ctx.exception.part_ids, [self.discs.pk])
+        self.pads.refresh_from_db()
+        self.assertEqual(self.pads.stock, self.stock)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_release_and_expiry_return_stock(self):
+        user = self.users[0]
+        hold = reserve(user, [(self.pads.pk, self.stock)])
+        self.pads.refresh_from_db()
+        self.assertEqual((self.pads.stock, self.pads.is_available), (0, False))
+
+        self.assertEqual(release(user, hold.hold), self.stock)
+        self.pads.refresh_from_db()
+        self.assertEqual((self.pads.stock, self.pads.is_available), (self.stock, True))
+
+        # A lapsed hold is swept when the next buyer comes up short
+        stale = reserve(user, [(self.pads.pk, self.stock)])
+        StockReservation.objects.filter(hold=stale.hold).update(expires_at=timezone.now() - timedelta(seconds=1))
+        fresh = reserve(self.users[1], [(self.pads.pk, 2)])
+        self.assertEqual(checkout(user, stale.hold), {})
+        self.assertEqual(checkout(self.users[1], fresh.hold), {self.pads.pk: 2})
+        self.pads.refresh_from_db()
+        self.assertEqual(self.pads.stock, self.stock - 2)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_release_restores_availability_only_where_a_hold_removed_it(self):
+        first, second = self.users[0], self.users[1]
+        # A seller who sold the rest elsewhere and switched the part off keeps it off
+        hold = reserve(first, [(self.pads.pk, 2)])
+        Part.objects.filter(pk=self.pads.pk).update(stock=0, is_available=False)
+        release(first, hold.hold)
+        self.pads.refresh_from_db()
+        self.assertEqual((self.pads.stock, self.pads.is_available), (2, False))
+
+        # The hold that sold the discs out is checked out; the other one still carries the mark
+        small = reserve(first, [(self.discs.pk, 2)])
+        last = reserve(second, [(self.discs.pk, self.stock - 2)])
+        checkout(second, last.hold)
+        release(first, small.hold)
+        self.discs.refresh_from_db()
+        self.assertEqual((self.discs.stock, self.discs.is_available), (2, True))
@@ -0,0 +1,122 @@
+"""
+Sliding-window throttles backed by the shared cache.
+
+Each client has one counter per window, and that counter also carries the
+previous window's total in its high bits. Steady state is a single
+``cache.incr`` that returns both counts, from which the usual
+sliding-window estimate is taken:
+
+    previous * (1 - elapsed fraction of current window) + current
+
+Only the first request of a window pays an extra read/add to seed the new
+counter, and a rejected request one ``decr`` to give its tokens back. Views
+can charge more than one token per request through
+``get_throttle_cost(request, scope)``; a cost of 0 skips the throttle.
+"""
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+KEY_PREFIX = 'throttle'
+# Current-window count lives in the low 32 bits, the previous window's in the high bits
+SHIFT = 32
+MASK = (1 << SHIFT) - 1
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'120/min'`` -> ``(120, 60)``; same format as DRF's ``DEFAULT_THROTTLE_RATES``."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    scope = None
+    # HTTP methods the throttle applies to; None means all of them
+    methods = None
+
+    def __init__(self):
+        try:
+            rate = api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f'No throttle rate set for scope "{self.scope}".')
+        self.limit, self.window = parse_rate(rate)
+        self.wait_seconds = None
+
+    def get_cost(self, request, view):
+        if self.methods is not None and request.method not in self.methods:
+            return 0
+        get_cost = getattr(view, 'get_throttle_cost', None)
+        return get_cost(request, self.scope) if get_cost is not None else 1
+
+    def get_client_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        cost = self.get_cost(request, view)
+        if not cost:
+            return True
+        now = time.time()
+        index, offset = divmod(now, self.window)
+        elapsed = offset / self.window
+        ident = self.get_client_ident(request)
+        previous, current = self.consume(ident, int(index), cost)
+        estimate = previous * (1 - elapsed) + current
+        if estimate <= self.limit:
+            return True
+        # Rejected requests are not charged, or retrying would extend the lockout
+        self.refund(ident, int(index), cost)
+        self.wait_seconds = self.retry_after(previous, current, elapsed)
+        return False
+
+    def consume(self, ident, index, cost):
+        """Add ``cost`` to this window; return ``(previous, current)`` totals."""
+        key = f'{KEY_PREFIX}:{self.scope}:{ident}:{index}'
+        try:
+            value = cache.incr(key, cost)
+        except ValueError:
+            # First request of the window: seed it with the previous window's total
+            previous = cache.get(f'{KEY_PREFIX}:{self.scope}:{ident}:{index - 1}', 0) & MASK
+            value = (previous << SHIFT) + cost
+            if not cache.add(key, value, self.window * 2):
+                value = cache.incr(key, cost)
+        return value >> SHIFT, value & MASK
+
+    def refund(self, ident, index, cost):
+        try:
+            cache.decr(f'{KEY_PREFIX}:{self.scope}:{ident}:{index}', cost)
+        except ValueError:
+            # The counter expired in between; nothing left to give back
+            pass
+
+    def retry_after(self, previous, current, elapsed):
+        remaining = (1 - elapsed) * self.window
+        if current > self.limit or not previous:
+            return remaining
+        # The previous window's share decays linearly; wait until it has dropped enough
+        needed = 1 - (self.limit - current) / previous
+        return max(0.0, min(remaining, (needed - elapsed) * self.window))
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class GeoSearchThrottle(SlidingWindowThrottle):
+    """Distance/bbox searches; views price individual query shapes."""
+    scope = 'geo_search'
+
+
+class ReviewCreateThrottle(SlidingWindowThrottle):
+    scope = 'review_create'
+    methods = {'POST'}
+
+
+class ForumPostThrottle(SlidingWindowThrottle):
+    """New threads and replies."""
+    scope = 'forum_post'
+    methods = {'POST'}
@@ -0,0 +1,104 @@
+import math
+
+from django.core.cache import cache
+from django.db import connections, router, transaction
+
+from .models import Garage
+
+MAX_ZOOM = 20
+# Clusters per tile edge: 8 cells of 32px on a 256px tile
+GRID_SIZE = 8
+TILE_CACHE_TIMEOUT = 60 * 60
+
+CLUSTER_SQL = """
+    SELECT count(*), ST_X(ST_Centroid(ST_Collect(geom))), ST_Y(ST_Centroid(ST_Collect(geom))),
+           min(id), CASE WHEN count(*) = 1 THEN min(name) END
+    FROM (
+        SELECT id, name, location::geometry AS geom,
+               ST_SnapToGrid(location::geometry, %(west)s, %(south)s, %(cell_x)s, %(cell_y)s) AS cell
+        FROM {table}
+        WHERE is_verified
+          AND location && ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326)::geography
+    ) AS points
+    GROUP BY cell
+"""
+
+
+def tile_bounds(z, x, y):
+    """Return (west, south, east, north) in degrees for a slippy-map tile."""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def tile_for_point(z, lon, lat):
+    """Return the (x, y) of the tile containing lon/lat at zoom z."""
+    n = 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_cache_key(z, x, y):
+    return f'garage-tile:{z}:{x}:{y}'
+
+
+def cluster_tile(z, x, y):
+    """Cluster verified garages of one tile on a GRID_SIZE x GRID_SIZE grid as GeoJSON."""
+    west, south, east, north = tile_bounds(z, x, y)
+    params = {
+        'west': west, 'south': south, 'east': east, 'north': north,
+        'cell_x': (east - west) / GRID_SIZE, 'cell_y': (north - south) / GRID_SIZE,
+    }
+    # Raw SQL skips the router unless asked; this keeps tiles on the request's replica
+    connection = connections[router.db_for_read(Garage)]
+    with connection.cursor() as cursor:
+        cursor.execute(CLUSTER_SQL.format(table=connection.ops.quote_name(Garage._meta.db_table)), params)
+        rows = cursor.fetchall()
+    features = []
+    for count, lon, lat, garage_id, name in rows:
+        properties = {'count': count}
+        if count == 1:
+            properties.update(garage_id=garage_id, name=name)
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': properties,
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def get_tile(z, x, y):
+    key = tile_cache_key(z, x, y)
+    tile = cache.get(key)
+    if tile is None:
+        tile = cluster_tile(z, x, y)
+        cache.set(key, tile, TILE_CACHE_TIMEOUT)
+    return tile
+
+
+def invalidate_tiles_for_points(points):
+    """Drop the cached tiles covering ``points`` at every zoom level; shared tiles are deleted once."""
+    keys = {
+        tile_cache_key(z, *tile_for_point(z, point.x, point.y))
+        for point in points if point is not None for z in range(MAX_ZOOM + 1)
+    }
+    if keys:
+        cache.delete_many(list(keys))
+
+
+def invalidate_tiles_on_commit(points):
+    """
+    ``invalidate_tiles_for_points`` once the current transaction commits, so a
+    read racing the write cannot cache the old tile again after the delete.
+    """
+    points = list(points)
+    transaction.on_commit(lambda: invalidate_tiles_for_points(points))
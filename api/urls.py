@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, profiling, views
 
 router = DefaultRouter()
 router.register(r'garages', views.GarageViewSet, basename='garage')
@@ -9,5 +9,24 @@ router.register(r'forum/threads', views.ForumThreadViewSet, basename='forumthrea
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('garages/tiles/<int:z>/<int:x>/<int:y>/', views.GarageTileView.as_view(), name='garage-tiles'),
     path('garages/<int:garage_pk>/reviews/', views.ReviewListCreateView.as_view(), name='garage-reviews'),
+    path('garages/<int:garage_pk>/inventory/parts/', views.PartInventoryBulkView.as_view(), name='garage-inventory-parts'),
+    path('garages/<int:garage_pk>/inventory/services/', views.ServicePriceBulkView.as_view(), name='garage-inventory-services'),
+    path('services/<int:service_pk>/offers/', views.ServiceOfferListView.as_view(), name='service-offers'),
+    path('forum/threads/<int:thread_pk>/posts/', views.ForumPostListCreateView.as_view(), name='forumthread-posts'),
+    path('reservations/', views.StockReservationView.as_view(), name='stock-reservations'),
+    path('reservations/<uuid:hold>/', views.StockReservationDetailView.as_view(), name='stock-reservation-detail'),
+    path('reservations/<uuid:hold>/checkout/', views.StockCheckoutView.as_view(), name='stock-checkout'),
+    path('export/<slug:resource>.<slug:fmt>', views.ExportView.as_view(), name='export'),
+    path('metrics/', profiling.metrics, name='metrics'),
+    # Async (ASGI) read path; same payloads as the routes above
+    path('async/garages/', async_views.garage_list, name='async-garage-list'),
+    path('async/garages/<int:pk>/', async_views.garage_detail, name='async-garage-detail'),
+    path('async/garages/<int:garage_pk>/reviews/', async_views.garage_reviews, name='async-garage-reviews'),
+    path('async/parts/', async_views.part_list, name='async-part-list'),
+    path('async/parts/<int:pk>/', async_views.part_detail, name='async-part-detail'),
+    # Server-Sent Events; resume with Last-Event-ID
+    path('forum/stream/', async_views.forum_thread_stream, name='forum-stream'),
+    path('forum/threads/<int:thread_pk>/stream/', async_views.forum_post_stream, name='forumthread-stream'),
 ]
\ No newline at end of file
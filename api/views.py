@@ -1,49 +1,337 @@
 from django.shortcuts import render
 
 # Create your views here.
-from django.contrib.gis.geos import Point
-from django.contrib.gis.db.models.functions import Distance
-from rest_framework import viewsets, generics, permissions
+from django.contrib.gis.measure import D
+from collections.abc import Iterable
+from decimal import Decimal, InvalidOperation
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce
+from rest_framework import viewsets, generics, permissions, views
+from rest_framework.exceptions import APIException, NotFound, ParseError
+from rest_framework.response import Response
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import Garage, Part, Review, ForumThread, ForumPost
+from django.utils.dateparse import parse_datetime
+from .models import Garage, GarageService, Part, Review, ForumThread, ForumPost, ServiceOffer
 from .serializers import (
-    GarageSerializer, PartSerializer, ReviewSerializer,
-    ForumThreadSerializer, ForumPostSerializer
+    GarageSerializer, GarageListSerializer, PartSerializer, ReviewSerializer,
+    ForumThreadSerializer, ForumPostSerializer, ServiceOfferSerializer, ReservationSerializer
 )
 from .permissions import IsOwnerOrReadOnly
+from .cache import CachedResponseMixin
+from .fastpath import CompiledListMixin
+from .replicas import ReplicaReadMixin
+from .throttling import ForumPostThrottle, GeoSearchThrottle, ReviewCreateThrottle
+from .export import EXPORTS, FORMATS as EXPORT_FORMATS, alines
+from .inventory import upsert_parts, upsert_service_prices
+from .parsers import CSVParser, FastJSONParser, NDJSONParser
+from .stock import OutOfStock, checkout, release, reserve
+from .geo import KNNDistance, parse_bbox, parse_point
+from .geocoding import GeocodingError, geocode, strip_near
+from .tiles import get_tile, is_valid_tile
 
-class GarageViewSet(viewsets.ReadOnlyModelViewSet):
+class GeocoderUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Place search is temporarily unavailable.'
+
+def resolve_location(params):
+    """The searcher's point from ``lat``/``lon``, else from a geocoded ``near`` place name."""
+    point = parse_point(params.get('lat'), params.get('lon'))
+    near = params.get('near')
+    if point is None and near:
+        try: point = geocode(strip_near(near))
+        except GeocodingError: raise GeocoderUnavailable()
+        if point is None:
+            raise ParseError(f'Unknown place "{near}".')
+    return point
+
+class GarageViewSet(ReplicaReadMixin, CachedResponseMixin, CompiledListMixin, viewsets.ReadOnlyModelViewSet):
+    cache_namespaces = ('garages',)
     serializer_class = GarageSerializer
-    queryset = Garage.objects.filter(is_verified=True).prefetch_related('reviews', 'services_offered__service')
+    list_serializer_class = GarageListSerializer
+    queryset = Garage.objects.filter(is_verified=True)
+    ordering = ('id',)
+    throttle_classes = [GeoSearchThrottle]
+    # Unrated garages rank as 0 so the sort key is never NULL (keyset pagination)
+    rating_orderings = {
+        'rating': ('rating_rank', 'rating_count', 'id'),
+        '-rating': ('-rating_rank', '-rating_count', '-id'),
+    }
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+    def get_throttle_cost(self, request, scope):
+        # Plain listings are cheap index walks; only spatial searches spend tokens
+        params = request.query_params
+        if params.get('lat') and params.get('lon'):
+            cost = 2
+        elif params.get('near'):
+            # May cost a call to the external geocoder as well
+            cost = 3
+        elif params.get('bbox'):
+            cost = 1
+        else:
+            return 0
+        if params.get('ordering') in self.rating_orderings:
+            # Sorting every match by rating instead of walking the KNN index
+            cost += 2
+        return cost
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        lat = self.request.query_params.get('lat')
-        lon = self.request.query_params.get('lon')
-        if lat and lon:
-            try:
-                user_location = Point(float(lon), float(lat), srid=4326)
-                queryset = queryset.annotate(distance=Distance('location', user_location)).order_by('distance')
-            except (ValueError, TypeError): pass
+        queryset = self.with_rendered_relations(super().get_queryset())
+        params = self.request.query_params
+        bbox = parse_bbox(params.get('bbox'))
+        if bbox is not None:
+            queryset = queryset.filter(location__bboverlaps=bbox)
+        user_location = resolve_location(params)
+        if user_location is not None:
+            radius_km = params.get('radius_km')
+            if radius_km:
+                try: queryset = queryset.filter(location__dwithin=(user_location, D(km=float(radius_km))))
+                except ValueError: pass
+            # <-> on the GiST-indexed geography column: nearest-first index scan
+            queryset = queryset.annotate(distance=KNNDistance('location', user_location)).order_by('distance', 'id')
         city = self.request.query_params.get('city')
         if city: queryset = queryset.filter(city__iexact=city)
+        min_rating = self.request.query_params.get('min_rating')
+        if min_rating:
+            try: queryset = queryset.filter(average_rating__gte=float(min_rating))
+            except ValueError: pass
+        ordering = self.rating_orderings.get(self.request.query_params.get('ordering'))
+        if ordering:
+            queryset = queryset.annotate(rating_rank=Coalesce('average_rating', Value(0.0))).order_by(*ordering)
         return queryset
 
-class PartViewSet(viewsets.ReadOnlyModelViewSet):
+    def with_rendered_relations(self, queryset):
+        # Only join/prefetch what the chosen serializer and ?fields=/?expand= will render
+        fields = set(self.get_serializer_class().resolve_field_names(self.request))
+        if 'owner' in fields:
+            queryset = queryset.select_related('owner')
+        if 'reviews' in fields:
+            queryset = queryset.prefetch_related('reviews__user')
+        if 'services_offered' in fields:
+            queryset = queryset.prefetch_related('services_offered__service')
+        if 'services_count' in fields:
+            # Correlated subquery rather than GROUP BY so KNN ordering can still use the index
+            services = GarageService.objects.filter(garage=OuterRef('pk')).order_by().values('garage')
+            queryset = queryset.annotate(services_count=Coalesce(
+                Subquery(services.annotate(c=Count('pk')).values('c'), output_field=IntegerField()), Value(0)))
+        return queryset
+
+class GarageTileView(ReplicaReadMixin, views.APIView):
+    """Grid-clustered verified garages for one z/x/y map tile, as GeoJSON."""
+    permission_classes = [permissions.AllowAny]
+    cache_max_age = 60
+
+    def get(self, request, z, x, y):
+        if not is_valid_tile(z, x, y):
+            raise NotFound('Tile out of range.')
+        response = Response(get_tile(z, x, y))
+        response['Cache-Control'] = f'public, max-age={self.cache_max_age}'
+        return response
+
+class ServiceOfferListView(ReplicaReadMixin, generics.ListAPIView):
+    """
+    Verified garages offering one service within ``radius_km`` (default 10)
+    of ``lat``/``lon`` (or a ``near`` place name), cheapest first or with ``?sort=distance`` nearest first.
+    """
+    serializer_class = ServiceOfferSerializer
+    throttle_classes = [GeoSearchThrottle]
+    default_radius_km = 10
+    sort_orderings = {'price': ('price', 'id'), 'distance': ('distance', 'id')}
+
+    def get_queryset(self):
+        params = self.request.query_params
+        point = resolve_location(params)
+        if point is None:
+            raise ParseError('lat and lon, or near, are required.')
+        try: radius_km = float(params.get('radius_km', self.default_radius_km))
+        except ValueError: raise ParseError('radius_km must be a number.')
+        ordering = self.sort_orderings.get(params.get('sort', 'price'), self.sort_orderings['price'])
+        return (ServiceOffer.objects
+                .filter(service_id=self.kwargs['service_pk'], location__dwithin=(point, D(km=radius_km)))
+                .annotate(distance=KNNDistance('location', point))
+                .select_related('garage')
+                .order_by(*ordering))
+
+class PartViewSet(ReplicaReadMixin, CachedResponseMixin, CompiledListMixin, viewsets.ReadOnlyModelViewSet):
+    cache_namespaces = ('parts',)
     queryset = Part.objects.filter(is_available=True).select_related('seller_garage', 'category')
     serializer_class = PartSerializer
+    ordering = ('id',)
+    # Minimum pg_trgm similarity for the typo-tolerant fallback on Part.name
+    trigram_threshold = 0.3
+
+    def get_queryset(self):
+        queryset = self.filter_catalogue(super().get_queryset())
+        q = self.request.query_params.get('q', '').strip()
+        if q:
+            matches = self.fulltext_matches(queryset, q)
+            queryset = matches if matches.exists() else self.fuzzy_matches(queryset, q)
+        return queryset
+
+    async def aget_queryset(self):
+        queryset = self.filter_catalogue(super().get_queryset())
+        q = self.request.query_params.get('q', '').strip()
+        if q:
+            matches = self.fulltext_matches(queryset, q)
+            queryset = matches if await matches.aexists() else self.fuzzy_matches(queryset, q)
+        return queryset
+
+    def filter_catalogue(self, queryset):
+        params = self.request.query_params
+        category = params.get('category')
+        if category: queryset = queryset.filter(category__slug=category)
+        seller = params.get('seller_garage')
+        if seller:
+            try: queryset = queryset.filter(seller_garage_id=int(seller))
+            except ValueError: pass
+        for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+            value = params.get(param)
+            if value:
+                try: queryset = queryset.filter(**{lookup: Decimal(value)})
+                except InvalidOperation: pass
+        if params.get('in_stock', '').lower() in ('1', 'true', 'yes'):
+            queryset = queryset.filter(stock__gt=0)
+        return queryset
 
-class ForumThreadViewSet(viewsets.ModelViewSet):
-    queryset = ForumThread.objects.all().prefetch_related('posts__author').select_related('author')
+    def fulltext_matches(self, queryset, q):
+        # Ranked full-text match on the stored, GIN-indexed vector. The rank is
+        # float4 in Postgres; cast it so the cursor's double round-trips exactly.
+        query = SearchQuery(q, config='english', search_type='websearch')
+        return (queryset.filter(search_vector=query)
+                .annotate(rank=Cast(SearchRank(F('search_vector'), query), FloatField()))
+                .order_by('-rank', 'id'))
+
+    def fuzzy_matches(self, queryset, q):
+        # Used when there is no lexeme hit (usually a typo): trigram similarity on the name
+        return (queryset.filter(name__trigram_similar=q)
+                .annotate(rank=Cast(TrigramSimilarity('name', q), FloatField()))
+                .filter(rank__gte=self.trigram_threshold)
+                .order_by('-rank', 'id'))
+
+class ForumThreadViewSet(ReplicaReadMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespaces = ('forum',)
+    queryset = ForumThread.objects.all().select_related('author', 'last_poster')
     serializer_class = ForumThreadSerializer
+    ordering = ('-created_at', '-id')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+    throttle_classes = [ForumPostThrottle]
     def perform_create(self, serializer): serializer.save(author=self.request.user)
 
-class ReviewListCreateView(generics.ListCreateAPIView):
+class ReviewListCreateView(ReplicaReadMixin, CompiledListMixin, generics.ListCreateAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [ReviewCreateThrottle]
+    ordering = ('-created_at', '-id')
     def get_queryset(self):
         return Review.objects.filter(garage_id=self.kwargs['garage_pk']).select_related('user')
     def perform_create(self, serializer):
         garage = get_object_or_404(Garage, pk=self.kwargs['garage_pk'])
         serializer.save(user=self.request.user, garage=garage)
+
+class ForumPostListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
+    serializer_class = ForumPostSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_classes = [ForumPostThrottle]
+    ordering = ('created_at', 'id')
+    def get_queryset(self):
+        return ForumPost.objects.filter(thread_id=self.kwargs['thread_pk']).select_related('author')
+    def perform_create(self, serializer):
+        thread = get_object_or_404(ForumThread, pk=self.kwargs['thread_pk'])
+        serializer.save(author=self.request.user, thread=thread)
+
+class InventoryBulkView(ReplicaReadMixin, views.APIView):
+    """
+    Base for garage-scoped bulk upserts. Accepts a JSON array, NDJSON or CSV
+    body and answers with created/updated counts plus per-row errors.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    parser_classes = [FastJSONParser, NDJSONParser, CSVParser]
+    upsert = None
+
+    def post(self, request, garage_pk):
+        garage = get_object_or_404(Garage, pk=garage_pk)
+        self.check_object_permissions(request, garage)
+        rows = request.data
+        # JSON gives a list, NDJSON and CSV a lazy generator of rows
+        if isinstance(rows, (dict, str, bytes)) or not isinstance(rows, Iterable):
+            raise ParseError('Expected a list of rows.')
+        return Response(self.upsert(garage, rows).as_dict())
+
+class PartInventoryBulkView(InventoryBulkView):
+    upsert = staticmethod(upsert_parts)
+
+class ServicePriceBulkView(InventoryBulkView):
+    upsert = staticmethod(upsert_service_prices)
+
+class StockReservationView(ReplicaReadMixin, views.APIView):
+    """
+    ``POST {"items": [{"part": id, "quantity": n}, ...]}`` holds stock for
+    ``STOCK_RESERVATION_TTL`` seconds. 409 lists the parts that fell short.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = ReservationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = [(item['part'], item['quantity']) for item in serializer.validated_data['items']]
+        try:
+            hold = reserve(request.user, items)
+        except OutOfStock as exc:
+            return Response({'detail': 'Not enough stock.', 'parts': exc.part_ids}, status=409)
+        return Response(hold.as_dict(), status=201)
+
+class StockReservationDetailView(ReplicaReadMixin, views.APIView):
+    """``DELETE`` gives the held stock back."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def delete(self, request, hold):
+        if not release(request.user, hold):
+            raise NotFound('No such reservation.')
+        return Response(status=204)
+
+class StockCheckoutView(ReplicaReadMixin, views.APIView):
+    """``POST`` completes a hold; the stock it took stays sold."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, hold):
+        items = checkout(request.user, hold)
+        if not items:
+            raise NotFound('No such reservation, or it has expired.')
+        return Response({'hold': str(hold), 'items': [{'part': p, 'quantity': q} for p, q in sorted(items.items())]})
+
+class ExportView(views.APIView):
+    """
+    Streams ``/api/export/<resource>.<ndjson|csv>`` row by row. ``?since=``
+    (ISO timestamp, matched against ``updated_at``) and ``?since_id=`` give
+    incremental exports; rows always come out in id order. Under ASGI the
+    body is an async iterator (``api.export.alines``) so it is not buffered.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, resource, fmt):
+        export = EXPORTS.get(resource)
+        if export is None or fmt not in EXPORT_FORMATS:
+            raise NotFound()
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                raise ParseError('since must be an ISO 8601 timestamp.')
+        since_id = request.query_params.get('since_id')
+        if since_id:
+            try: since_id = int(since_id)
+            except ValueError: raise ParseError('since_id must be an integer.')
+        content_type, write_lines = EXPORT_FORMATS[fmt]
+        lines = write_lines(export, export.rows(since=since or None, since_id=since_id or None))
+        if isinstance(request._request, ASGIRequest):
+            lines = alines(lines)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{fmt}"'
+        return response
@@ -3,6 +3,14 @@ ASGI config for online_garage project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The async read path (``/api/async/...``) only pays off under an ASGI server, e.g.:
+
+    uvicorn online_garage.asgi:application --workers 4
+
+The forum event streams (``/api/forum/stream/`` and
+``/api/forum/threads/<id>/stream/``) need it: each open connection is a
+coroutine here, but would pin a whole worker thread under WSGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
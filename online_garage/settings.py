@@ -48,8 +48,8 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     # Third-party apps
     'django.contrib.gis',
+    'django.contrib.postgres',
     'rest_framework',
-    'rest_framework.authtoken',
     'dj_rest_auth',
     'django.contrib.sites',
     'allauth',
@@ -73,6 +73,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Opt-in request instrumentation (api.profiling): query count, SQL and serializer
+# time, Server-Timing headers, slow/N+1 logs and /api/metrics/ histograms
+REQUEST_PROFILING = env.bool('REQUEST_PROFILING', default=False)
+REQUEST_PROFILING_SAMPLE_RATE = env.float('REQUEST_PROFILING_SAMPLE_RATE', default=0.05)
+SLOW_REQUEST_MS = env.int('SLOW_REQUEST_MS', default=500)
+DUPLICATE_QUERY_THRESHOLD = env.int('DUPLICATE_QUERY_THRESHOLD', default=5)
+# Bearer token for /api/metrics/; without one the endpoint only answers staff sessions
+METRICS_TOKEN = env.str('METRICS_TOKEN', default='')
+if REQUEST_PROFILING:
+    MIDDLEWARE.insert(0, 'api.profiling.RequestProfilingMiddleware')
+
 ROOT_URLCONF = 'online_garage.urls'
 
 TEMPLATES = [
@@ -91,17 +102,32 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'online_garage.wsgi.application'
+ASGI_APPLICATION = 'online_garage.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections come from a psycopg 3 pool per worker process instead of a new
+# PostGIS connection per request. Pooling replaces CONN_MAX_AGE; Django
+# refuses to combine the two. DATABASE_POOL_ENABLED=false turns it off.
+DATABASE_POOL = {
+    'min_size': env.int('DATABASE_POOL_MIN_SIZE', default=2),
+    'max_size': env.int('DATABASE_POOL_MAX_SIZE', default=10),
+    'timeout': env.int('DATABASE_POOL_TIMEOUT', default=10),
+}
+
+
+def postgis_database(url):
+    config = env.db_url_config(url, engine='django.contrib.gis.db.backends.postgis')  # Use PostGIS for GIS support
+    if env.bool('DATABASE_POOL_ENABLED', default=True):
+        config.setdefault('OPTIONS', {})['pool'] = dict(DATABASE_POOL)
+    return config
+
+
 DATABASES = {
     # Parse DB url automatically
-     'default': env.db_url(
-         'DATABASE_URL',
-         engine='django.contrib.gis.db.backends.postgis'  # Use PostGIS for GIS support
-         )
+     'default': postgis_database(env.str('DATABASE_URL')),
          
     #      {
     # #     'ENGINE': 'django.db.backends.sqlite3',
@@ -118,6 +144,23 @@ DATABASES = {
 
 # DATABASES ['default']['ENGINE'] = 'django.contrib.gis.db.backends.postgis'
 
+# Read replicas as a comma-separated list, e.g.
+# DATABASE_REPLICA_URLS=postgis://replica-1/garage,postgis://replica-2/garage
+# Safe requests to the read-only API views are spread across them; see api.replicas.
+DATABASE_REPLICAS = []
+for _index, _url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), start=1):
+    DATABASES[f'replica{_index}'] = {**postgis_database(_url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{_index}')
+DATABASE_ROUTERS = ['api.replicas.PrimaryReplicaRouter']
+# After a write the user's reads stay on the primary this long, to cover replication lag
+DATABASE_REPLICA_PIN_SECONDS = env.int('DATABASE_REPLICA_PIN_SECONDS', default=5)
+
+# Cache
+# locmemcache:// by default; point CACHE_URL at redis://host:6379/1 to share it across workers
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -157,6 +200,8 @@ STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 # STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Worker processes for background thumbnail/WebP rendering (api.images)
+IMAGE_RENDITION_WORKERS = env.int('IMAGE_RENDITION_WORKERS', default=2)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -168,10 +213,56 @@ CORS_ALLOWED_ORIGINS = [env('FRONTEND_URL')]
 
 # DRF and Auth Settings
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework.authentication.TokenAuthentication',),
-    'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAuthenticatedOrReadOnly',)
+    'DEFAULT_AUTHENTICATION_CLASSES': ('api.authentication.CachedTokenAuthentication',),
+    'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAuthenticatedOrReadOnly',),
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    # orjson-backed when installed, same bytes as the stock JSON classes otherwise
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'PAGE_SIZE': 20,
+    # Sliding-window limits for api.throttling; geo searches cost 1-4 tokens each
+    'DEFAULT_THROTTLE_RATES': {
+        'geo_search': env.str('THROTTLE_GEO_SEARCH', default='120/min'),
+        'review_create': env.str('THROTTLE_REVIEW_CREATE', default='10/hour'),
+        'forum_post': env.str('THROTTLE_FORUM_POST', default='30/hour'),
+    },
 }
 
+# API tokens are api.models.AuthToken rows, which keep only the SHA-256 digest of the key
+REST_AUTH = {
+    'TOKEN_MODEL': 'api.models.AuthToken',
+    'TOKEN_CREATOR': 'api.authentication.create_token',
+    'TOKEN_SERIALIZER': 'api.serializers.AuthTokenSerializer',
+    # Adds the profile, with its picture renditions, to /api/auth/user/
+    'USER_DETAILS_SERIALIZER': 'api.serializers.UserDetailsSerializer',
+}
+
+# Token lookup cache (api.authentication): shared-cache TTL, per-process LRU TTL and size
+AUTH_TOKEN_CACHE_TTL = env.int('AUTH_TOKEN_CACHE_TTL', default=60)
+AUTH_TOKEN_LRU_TTL = env.int('AUTH_TOKEN_LRU_TTL', default=5)
+AUTH_TOKEN_LRU_SIZE = env.int('AUTH_TOKEN_LRU_SIZE', default=10000)
+
+# Geocoding (api.geocoding). The offline gazetteer needs no network; for real lookups use e.g.
+# GEOCODER_PROVIDER=api.geocoding.GeopyProvider
+# GEOCODER_OPTIONS='{"backend": "nominatim", "user_agent": "online-garage", "min_delay_seconds": 1}'
+GEOCODER_PROVIDER = env.str('GEOCODER_PROVIDER', default='api.geocoding.OfflineProvider')
+GEOCODER_OPTIONS = env.json('GEOCODER_OPTIONS', default={})
+GEOCODER_CONCURRENCY = env.int('GEOCODER_CONCURRENCY', default=4)
+GEOCODER_LRU_SIZE = env.int('GEOCODER_LRU_SIZE', default=2048)
+GEOCODER_LRU_TTL = env.int('GEOCODER_LRU_TTL', default=3600)
+# Places the provider could not find are asked about again after this many seconds
+GEOCODER_MISS_TTL = env.int('GEOCODER_MISS_TTL', default=86400)
+
+# Seconds a part reservation holds its stock before release_expired_reservations hands it back
+STOCK_RESERVATION_TTL = env.int('STOCK_RESERVATION_TTL', default=900)
+
 # Allauth settings
 ACCOUNT_USER_MODEL_USERNAME_FIELD = None  # We don't use a username
 ACCOUNT_AUTHENTICATION_METHOD = 'email'   # Login with email